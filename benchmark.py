@@ -0,0 +1,324 @@
+"""性能基准测试
+
+使用固定种子的工作负载测量：
+- DA引擎每秒的调用次数（4x4市场和更大的带容量的随机市场）
+- generate_updated_preferences 和 sample_updated_preferences 每秒的调用次数
+- run_simulation 端到端的单案例耗时和内存峰值
+- 各输出格式每个策略组合占用的字节数
+
+结果保存为JSON（benchmark_results_[时间戳].json），每条记录有唯一的 name，
+可以用 compare_results 或 `python benchmark.py --compare 旧文件 新文件` 对比两次运行。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from matching_simulation import MatchingSimulation
+from best_response import best_response_case
+from preference_space import get_update_table
+from run_matching import count_scenarios, prepare_simulation, run_simulation, save_simulation_data
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，没有安装时跳过批量DA的基准
+    np = None
+
+# 市场名称 -> (学生数, 学校数, 学校容量)
+MARKETS = {
+    "4x4": (4, 4, None),
+    "30x10_cap3": (30, 10, [3] * 10),
+    "200x20_cap10": (200, 20, [10] * 20),
+}
+# 每个市场测试的随机偏好组合数（legacy 引擎在大市场上很慢，单独限制）
+PROFILE_COUNTS = {"4x4": 2000, "30x10_cap3": 300, "200x20_cap10": 30}
+LEGACY_PROFILE_LIMIT = 100
+OUTPUT_FORMATS = [".json", ".jsonl", ".jsonl.gz", ".sqbm"]
+
+
+def _random_profiles(sim: MatchingSimulation, count: int,
+                     rng: random.Random) -> List[Tuple[Dict[str, List[str]], Dict[str, List[str]]]]:
+    """生成 count 个完整的随机偏好组合 (学生偏好, 学校偏好)"""
+    profiles = []
+    for _ in range(count):
+        student_prefs = {student: rng.sample(sim.schools, len(sim.schools)) for student in sim.students}
+        school_prefs = {school: rng.sample(sim.students, len(sim.students)) for school in sim.schools}
+        profiles.append((student_prefs, school_prefs))
+    return profiles
+
+
+def _best_time(func, repeat: int) -> float:
+    """重复运行 repeat 次，返回最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_da(market: str, engine: str, n_profiles: int, repeat: int = 3, seed: int = 0) -> dict:
+    """测量 da_algorithm 在给定引擎下每秒的调用次数"""
+    n_students, n_schools, capacities = MARKETS[market]
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    sim.set_engine(engine)
+    profiles = _random_profiles(sim, n_profiles, random.Random(seed))
+
+    def run():
+        for student_prefs, school_prefs in profiles:
+            sim.da_algorithm(student_prefs, school_prefs)
+
+    seconds = _best_time(run, repeat)
+    return {"name": f"da/{market}/{engine}", "calls": n_profiles, "seconds": seconds,
+            "calls_per_second": n_profiles / seconds}
+
+
+def bench_da_batch(market: str, n_profiles: int, repeat: int = 3, seed: int = 0) -> dict:
+    """测量 da_algorithm_batch 每秒计算的偏好组合数（需要numpy，只支持单位容量）"""
+    n_students, n_schools, capacities = MARKETS[market]
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    profiles = _random_profiles(sim, n_profiles, random.Random(seed))
+    student_prefs = [profile[0] for profile in profiles]
+    school_prefs = [profile[1] for profile in profiles]
+    seconds = _best_time(lambda: sim.da_algorithm_batch(student_prefs, school_prefs), repeat)
+    return {"name": f"da/{market}/batch", "calls": n_profiles, "seconds": seconds,
+            "calls_per_second": n_profiles / seconds}
+
+
+def bench_updated_preferences(market: str, n_profiles: int, repeat: int = 3, seed: int = 0) -> dict:
+    """测量 generate_updated_preferences 每秒的调用次数"""
+    n_students, n_schools, capacities = MARKETS[market]
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    profiles = _random_profiles(sim, n_profiles, random.Random(seed))
+    matchings = [sim.da_algorithm(*profile) for profile in profiles]
+
+    def run():
+        for (student_prefs, _), matching in zip(profiles, matchings):
+            sim.generate_updated_preferences(matching, student_prefs)
+
+    seconds = _best_time(run, repeat)
+    return {"name": f"updated_preferences/{market}", "calls": n_profiles, "seconds": seconds,
+            "calls_per_second": n_profiles / seconds}
+
+
+def bench_sampled_updates(market: str, n_profiles: int, repeat: int = 3, seed: int = 0) -> dict:
+    """
+    测量 sample_updated_preferences（每个学生采样一种更新）每秒的调用次数
+
+    与 simulate_case 相同：能填满更新表的市场按排列编号查表，编号每个偏好组合只计算一次（不计时）；
+    其他市场只构造被选中的更新。
+    """
+    n_students, n_schools, capacities = MARKETS[market]
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    get_update_table(sim.schools).precompute()
+    profiles = _random_profiles(sim, n_profiles, random.Random(seed))
+    matchings = [sim.da_algorithm(*profile) for profile in profiles]
+    indices = [sim.preference_indices([student_prefs[student] for student in sim.students[1:]])
+               for student_prefs, _ in profiles]
+
+    def run():
+        rng = random.Random(seed)
+        for (student_prefs, _), matching, pref_indices in zip(profiles, matchings, indices):
+            sim.sample_updated_preferences(matching, student_prefs, 1, rng, pref_indices)
+
+    seconds = _best_time(run, repeat)
+    return {"name": f"sampled_updates/{market}", "calls": n_profiles, "seconds": seconds,
+            "calls_per_second": n_profiles / seconds}
+
+
+def bench_sampled_updates_full_lists(market: str, n_profiles: int, repeat: int = 3, seed: int = 0) -> dict:
+    """对照：生成全部候选（generate_updated_preferences）后对每个学生调用 rng.sample，结果与 sampled_updates 相同"""
+    n_students, n_schools, capacities = MARKETS[market]
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    profiles = _random_profiles(sim, n_profiles, random.Random(seed))
+    matchings = [sim.da_algorithm(*profile) for profile in profiles]
+
+    def run():
+        rng = random.Random(seed)
+        for (student_prefs, _), matching in zip(profiles, matchings):
+            updates = sim.generate_updated_preferences(matching, student_prefs)
+            for student in sim.students[1:]:
+                rng.sample(updates[student], min(1, len(updates[student])))
+
+    seconds = _best_time(run, repeat)
+    return {"name": f"sampled_updates_full_lists/{market}", "calls": n_profiles, "seconds": seconds,
+            "calls_per_second": n_profiles / seconds}
+
+
+def bench_pipeline(seed: int = 0, sample_size: int = 200, search: str = "sample") -> dict:
+    """
+    测量 run_simulation 的端到端性能
+
+    所有采样的案例都会被计算（max_cases 等于 sample_size）；耗时和内存峰值分两次运行测量，
+    避免 tracemalloc 的开销影响耗时。
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def run(name):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return run_simulation(seed=seed, sample_size=sample_size, max_cases=sample_size,
+                                      output_path=os.path.join(tmpdir, name + ".jsonl"),
+                                      search=search)
+
+        start = time.perf_counter()
+        simulation_data, _ = run("timed")
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            run("traced")
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    metadata = simulation_data["metadata"]
+    evaluated_cases = metadata["evaluated_cases"]
+    return {
+        "name": f"pipeline/{search}",
+        "evaluated_cases": evaluated_cases,
+        "total_scenarios": metadata["total_scenarios"],
+        "seconds": seconds,
+        "case_latency_ms": seconds / evaluated_cases * 1000 if evaluated_cases else 0.0,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def bench_output_size(output_format: str, seed: int = 0, n_cases: int = 20) -> dict:
+    """
+    测量各输出格式每个策略组合占用的字节数
+
+    有利案例很少，所以这里用最优反应搜索计算 n_cases 个案例并全部写入文件，而不是只保存有利案例。
+    """
+    sim, all_prefs, sampled_combinations, simulation_data = prepare_simulation(seed, n_cases)
+    simulation_data["cases"] = [best_response_case(sim, case_index, combination)
+                                for case_index, combination in enumerate(sampled_combinations)]
+    scenarios = sum(count_scenarios(case_data)[0] for case_data in simulation_data["cases"])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = save_simulation_data(simulation_data, os.path.join(tmpdir, "cases" + output_format))
+        output_bytes = os.path.getsize(filename)
+    return {
+        "name": f"output/{output_format.lstrip('.')}",
+        "cases": n_cases,
+        "scenarios": scenarios,
+        "output_bytes": output_bytes,
+        "output_bytes_per_scenario": output_bytes / scenarios if scenarios else None,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(quick: bool = False, seed: int = 0) -> dict:
+    """运行全部基准测试，quick 为 True 时只用十分之一的工作量"""
+    scale = 10 if quick else 1
+    results = []
+    for market, count in PROFILE_COUNTS.items():
+        count = max(1, count // scale)
+        for engine in ("rank", "legacy"):
+            n_profiles = min(count, LEGACY_PROFILE_LIMIT) if engine == "legacy" else count
+            results.append(bench_da(market, engine, n_profiles, seed=seed))
+        if np is not None and MARKETS[market][2] is None:
+            results.append(bench_da_batch(market, count, seed=seed))
+        results.append(bench_updated_preferences(market, count, seed=seed))
+        results.append(bench_sampled_updates(market, count, seed=seed))
+        results.append(bench_sampled_updates_full_lists(market, count, seed=seed))
+    results.append(bench_pipeline(seed=seed, sample_size=200 // scale))
+    results.append(bench_pipeline(seed=seed, sample_size=50 // scale, search="best_response"))
+    for output_format in OUTPUT_FORMATS:
+        results.append(bench_output_size(output_format, seed=seed, n_cases=max(2, 20 // scale)))
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "seed": seed,
+            "quick": quick,
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "numpy": np.__version__ if np is not None else None
+        },
+        "results": results
+    }
+
+
+# 对比时关注的指标，以及数值越大是否越好
+COMPARED_METRICS = {
+    "calls_per_second": True,
+    "case_latency_ms": False,
+    "peak_memory_bytes": False,
+    "output_bytes_per_scenario": False,
+}
+
+
+def compare_results(old: dict, new: dict) -> List[dict]:
+    """按 name 对比两次运行的结果，ratio 为 新/旧，improved 表示是否变好"""
+    old_results = {result["name"]: result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        previous = old_results.get(result["name"])
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if result.get(metric) is None or not previous.get(metric):
+                continue
+            ratio = result[metric] / previous[metric]
+            rows.append({"name": result["name"], "metric": metric, "old": previous[metric],
+                         "new": result[metric], "ratio": ratio,
+                         "improved": ratio > 1 if higher_is_better else ratio < 1})
+    return rows
+
+
+def _print_results(results: dict):
+    for result in results["results"]:
+        if "calls_per_second" in result:
+            print(f"{result['name']:<32} {result['calls_per_second']:>12.0f} 次/秒")
+        elif "case_latency_ms" in result:
+            print(f"{result['name']:<32} {result['case_latency_ms']:>9.2f} 毫秒/案例  "
+                  f"内存峰值 {result['peak_memory_bytes'] / 1024:.0f} KB")
+        else:
+            print(f"{result['name']:<32} {result['output_bytes_per_scenario']:>9.1f} 字节/策略组合")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="DA引擎和模拟流程的性能基准测试")
+    parser.add_argument("--quick", action="store_true", help="只运行十分之一的工作量")
+    parser.add_argument("--seed", type=int, default=0, help="工作负载的随机种子")
+    parser.add_argument("--output", help="结果文件名，默认为 benchmark_results_[时间戳].json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两个结果文件，不运行测试")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        for row in compare_results(old, new):
+            mark = "+" if row["improved"] else "-"
+            print(f"{mark} {row['name']:<32} {row['metric']:<26} {row['old']:>12.4g} -> "
+                  f"{row['new']:>12.4g} ({row['ratio']:.2f}x)")
+        return
+
+    results = run_benchmarks(args.quick, args.seed)
+    _print_results(results)
+    filename = args.output or f"benchmark_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"基准测试结果已保存到: {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""最优反应搜索：对一个偏好组合精确找出 s1 所有有利的虚假申报及第二轮更新组合
+
+与 simulate_case 只随机测试3种虚假申报、每个学生1种更新不同，这里检查 s1 的全部虚假申报
+（学校的全部排列，与 max_perms 无关）和其他学生全部第二轮更新的组合，输出与 simulate_case 相同结构的案例数据。
+
+DA的结果只取决于每个学生申报列表中直到其匹配学校为止的前缀，搜索利用这一点减少DA调用：
+- 第一轮：前缀相同的虚假申报复用同一个匹配结果，与诚实匹配相同的申报直接跳过；
+- 第二轮：只通过第一轮匹配结果依赖于虚假申报，相同的第一轮匹配只搜索一次；
+- 第二轮的更新组合中，某个学生的匹配学校排在其被提前的学校之前时，
+  提前到更靠后位置的更新都得到相同结果，这些组合直接复用已计算的匹配。
+"""
+from itertools import permutations, product
+from math import factorial
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from da_engine import build_rank_table, da_int
+from exhaustive import _StrategySearch, _updated_candidates
+from matching_simulation import MatchingSimulation
+
+# 默认搜索 s1 的全部 m! 种申报：8所学校时一个案例约需1.5秒，9所时需要数秒到数十秒，
+# 更大的市场无法完成，超过这个数量时必须显式给出 reports
+MAX_DEFAULT_REPORTS = factorial(8)
+
+
+def _equivalent_range(pref: Tuple[int, ...], moved: int, position: int, assigned: int,
+                      n_candidates: int) -> Tuple[int, int]:
+    """返回与第 position 种更新结果相同的更新位置范围（闭区间）
+
+    pref 为学生第一轮的申报，moved 为被提前的学校（第一轮匹配学校），assigned 为第二轮匹配学校。
+    """
+    if moved == -1 or assigned == -1 or assigned == moved:
+        return position, position
+    rest = [school for school in pref if school != moved]
+    assigned_position = rest.index(assigned)
+    if position <= assigned_position:
+        return position, position
+    # 匹配学校之前的前缀不含被提前的学校，提前到其后任意位置都不影响结果
+    return assigned_position + 1, n_candidates - 1
+
+
+def _second_round_matchings(true_pref: Tuple[int, ...], other_prefs: List[Tuple[int, ...]],
+                            first: List[int], ranks: List[List[int]],
+                            quota: List[int]) -> Tuple[List[Tuple[List[Tuple[int, ...]], List[int]]], int]:
+    """按 product 的顺序返回全部更新组合及其第二轮匹配结果，以及实际的DA调用次数"""
+    candidates = [_updated_candidates(pref, school) for pref, school in zip(other_prefs, first[1:])]
+    covers = []  # (每个学生的等价更新位置范围, 匹配结果)
+    results = []
+    calls = 0
+    for positions in product(*(range(len(options)) for options in candidates)):
+        updated = [options[k] for options, k in zip(candidates, positions)]
+        for ranges, matching in covers:
+            if all(lo <= k <= hi for k, (lo, hi) in zip(positions, ranges)):
+                break
+        else:
+            matching = da_int([true_pref] + updated, ranks, quota)
+            calls += 1
+            ranges = [_equivalent_range(pref, school, k, assigned, len(options))
+                      for pref, school, k, assigned, options
+                      in zip(other_prefs, first[1:], positions, matching[1:], candidates)]
+            covers.append((ranges, matching))
+        results.append((updated, matching))
+    return results, calls
+
+
+def check_report_space(n_schools: int):
+    """默认搜索 s1 的全部排列时，排列数超过 MAX_DEFAULT_REPORTS 则抛出 ValueError"""
+    if factorial(n_schools) > MAX_DEFAULT_REPORTS:
+        raise ValueError(f"best_response 搜索要检查 s1 的全部 {n_schools}! 种申报，"
+                         f"最多支持8所学校；更大的市场请给出 reports 或使用 sample 搜索")
+
+
+def best_response_case(sim: MatchingSimulation, case_index: int, combination: Tuple,
+                       reports: Iterable[Sequence[str]] = None) -> dict:
+    """
+    检查 s1 的全部虚假申报和全部第二轮更新组合，返回与 simulate_case 相同结构的案例数据
+
+    reports 为 s1 可以申报的偏好，默认为学校的全部排列（按字典序逐个生成，不预先展开）；
+    全部排列数超过 MAX_DEFAULT_REPORTS（多于8所学校）时不给出 reports 会抛出 ValueError，
+    这种搜索只适用于小市场。
+
+    案例数据额外包含 search_stats：实际的DA调用次数 da_calls，
+    以及逐个组合计算时需要的调用次数 brute_force_calls。
+    """
+    students, schools = sim.students, sim.schools
+    if reports is None:
+        check_report_space(len(schools))
+    s1, others = students[0], students[1:]
+    n_students = len(students)
+    quota, school_index, student_index = sim._quota, sim._school_index, sim._student_index
+
+    def true_rank(school):
+        # s1按真实偏好对学校的排名，未匹配排在所有学校之后
+        return sim.s1_true_pref.index(school) if school is not None else len(sim.s1_true_pref)
+
+    student_combination = combination[:len(others)]
+    school_combination = combination[len(others):]
+    honest_prefs = {s1: sim.s1_true_pref}
+    honest_prefs.update({student: list(pref) for student, pref in zip(others, student_combination)})
+    school_prefs = {school: list(pref) for school, pref in zip(schools, school_combination)}
+
+    true_pref = tuple(school_index[school] for school in sim.s1_true_pref)
+    other_prefs = [tuple(school_index[school] for school in honest_prefs[student]) for student in others]
+    ranks = build_rank_table([[student_index[student] for student in school_prefs[school]]
+                              for school in schools], n_students)
+
+    search = _StrategySearch(true_pref, other_prefs, ranks, quota)
+    honest_matching = sim._decode_matching(search.honest)
+    honest_school = honest_matching.get(s1)
+    brute_force_calls = 1
+
+    case_data = {
+        "case_id": case_index,
+        "initial_setup": {
+            "student_preferences": dict(honest_prefs),
+            "school_preferences": dict(school_prefs)
+        },
+        "honest_scenario": {
+            "first_round": {
+                "preferences": honest_prefs,
+                "matching": honest_matching
+            }
+        },
+        "strategic_scenarios": []
+    }
+
+    def second_round_matchings(first):
+        return _second_round_matchings(true_pref, other_prefs, first, ranks, quota)
+
+    if reports is None:
+        reports = permutations(schools)
+    for s1_false_pref in reports:
+        if list(s1_false_pref) == sim.s1_true_pref:
+            continue
+        brute_force_calls += 1
+        first = search.first_round(tuple(school_index[school] for school in s1_false_pref))
+        if first == search.honest:
+            continue
+        second_rounds = search.second_round(first, second_round_matchings)
+        brute_force_calls += len(second_rounds)
+
+        strategic_first_prefs = dict(honest_prefs)
+        strategic_first_prefs[s1] = list(s1_false_pref)
+        strategic_scenario = {
+            "false_preference": list(s1_false_pref),
+            "first_round": {
+                "preferences": strategic_first_prefs,
+                "matching": sim._decode_matching(first)
+            },
+            "second_round_scenarios": []
+        }
+        for updated, matching in second_rounds:
+            strategic_second_round_prefs = {s1: sim.s1_true_pref}
+            strategic_second_round_prefs.update(
+                (student, [schools[school] for school in pref]) for student, pref in zip(others, updated))
+            strategic_second_matching = sim._decode_matching(matching)
+            strategic_final_school = strategic_second_matching.get(s1)
+            strategic_scenario["second_round_scenarios"].append({
+                "updated_preferences": strategic_second_round_prefs,
+                "matching": strategic_second_matching,
+                "outcome": {
+                    "honest_result": honest_school,
+                    "strategic_result": strategic_final_school,
+                    "is_beneficial": true_rank(strategic_final_school) < true_rank(honest_school)
+                }
+            })
+        case_data["strategic_scenarios"].append(strategic_scenario)
+
+    case_data["search_stats"] = {"da_calls": search.da_calls, "brute_force_calls": brute_force_calls}
+    return case_data
+
+
+def beneficial_strategies(case_data: dict) -> List[Tuple[List[str], Dict[str, List[str]]]]:
+    """列出案例中所有有利的 (虚假申报, 第二轮更新后的偏好) 组合"""
+    return [(strategy["false_preference"], second_round["updated_preferences"])
+            for strategy in case_data["strategic_scenarios"]
+            for second_round in strategy["second_round_scenarios"]
+            if second_round["outcome"]["is_beneficial"]]
@@ -0,0 +1,59 @@
+"""run_simulation 的检查点
+
+每个案例的随机数生成器由 (seed, case_index) 决定，采样的偏好组合也只由 seed 和参数决定，
+所以检查点只需要保存运行参数（包括 seed）、下一个要计算的案例编号、累计的计数和已找到的有利案例。
+恢复时重新生成同样的偏好组合，从下一个案例继续，最终结果与不中断的运行完全相同。
+
+检查点为JSON文件，先写入临时文件再替换，写入过程中中断不会破坏上一个检查点。
+使用流式输出时有利案例已经在结果文件中，检查点只记录已写入的案例数；
+恢复时只保留结果文件中的这些案例，中断前多写入的案例会被重新计算。
+"""
+import json
+import os
+from typing import List
+
+from result_io import open_cases, open_result_writer
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path: str, state: dict):
+    """原子地写入检查点"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(state, version=CHECKPOINT_VERSION), f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} 不是受支持的检查点文件")
+    return state
+
+
+def restore_stream_writer(output_path: str, written_cases: int, metadata: dict,
+                          students: List[str], schools: List[str]):
+    """重新打开流式结果文件，只保留前 written_cases 个案例，返回可以继续写入的写入器"""
+    # 保留扩展名，按同样的格式读取
+    directory, name = os.path.split(output_path)
+    partial_path = os.path.join(directory, "partial_" + name)
+    os.replace(output_path, partial_path)
+    writer = open_result_writer(output_path, metadata, students, schools)
+    cases = open_cases(partial_path)
+    try:
+        for case_data in cases:
+            if writer.case_count >= written_cases:
+                break
+            writer.write_case(case_data)
+    finally:
+        if hasattr(cases, "close"):
+            cases.close()
+    if writer.case_count < written_cases:
+        writer.close()
+        raise ValueError(f"{partial_path} 中只有 {writer.case_count} 个案例，检查点记录了 {written_cases} 个")
+    os.remove(partial_path)
+    return writer
@@ -0,0 +1,327 @@
+"""整数编码的DA引擎
+
+学生和学校都用从0开始的整数编号表示，学生偏好是学校编号的列表，
+学校偏好预先转换为排名表（逆排列），提议循环只在扁平列表上运行，
+不再出现 list.index 查找和 list.remove 操作。
+"""
+import heapq
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，只有批量引擎需要
+    np = None
+
+
+def build_rank_table(school_prefs: Sequence[Sequence[int]], n_students: int) -> List[List[int]]:
+    """把学校偏好转换为排名表，ranks[c][s] 为学生s在学校c偏好中的位置
+
+    未出现在学校偏好中的学生排名记为 n_students，表示不可接受。
+    """
+    ranks = []
+    for pref in school_prefs:
+        row = [n_students] * n_students
+        for pos, student in enumerate(pref):
+            row[student] = pos
+        ranks.append(row)
+    return ranks
+
+
+def da_int(student_prefs: Sequence[Sequence[int]],
+           school_ranks: Sequence[Sequence[int]],
+           capacities: Optional[Sequence[int]] = None) -> List[int]:
+    """学生提议的DA算法（整数版）
+
+    返回长度为学生数的列表，第s项为学生s匹配到的学校编号，未匹配为-1。
+    DA的结果与提议顺序无关，这里依次处理每个学生，被替换下来的学生立即继续申请。
+    capacities 为各学校的名额，为空时每个学校一个名额。
+    """
+    if capacities is not None:
+        return _da_int_quota(student_prefs, school_ranks, capacities)
+    n_students = len(student_prefs)
+    held = [-1] * len(school_ranks)      # 学校 -> 当前暂时接受的学生
+    next_choice = [0] * n_students       # 学生下一个要申请的偏好位置
+
+    for student in range(n_students):
+        proposer = student
+        while proposer != -1:
+            pref = student_prefs[proposer]
+            pos = next_choice[proposer]
+            if pos >= len(pref):
+                # 已申请完所有学校，保持未匹配
+                break
+            school = pref[pos]
+            next_choice[proposer] = pos + 1
+
+            rank = school_ranks[school]
+            if rank[proposer] >= n_students:
+                continue
+            current = held[school]
+            if current == -1:
+                held[school] = proposer
+                proposer = -1
+            elif rank[proposer] < rank[current]:
+                held[school] = proposer
+                proposer = current
+
+    matching = [-1] * n_students
+    for school, student in enumerate(held):
+        if student != -1:
+            matching[student] = school
+    return matching
+
+
+def _da_int_quota(student_prefs: Sequence[Sequence[int]],
+                  school_ranks: Sequence[Sequence[int]],
+                  capacities: Sequence[int]) -> List[int]:
+    """有名额的DA算法，每个学校用堆维护已接受的学生，堆顶为排名最低者
+
+    复杂度为 O(提议总数 · log 名额)。
+    """
+    n_students = len(student_prefs)
+    held = [[] for _ in school_ranks]    # 学校 -> [(-排名, 学生)] 的堆
+    next_choice = [0] * n_students
+
+    for student in range(n_students):
+        proposer = student
+        while proposer != -1:
+            pref = student_prefs[proposer]
+            pos = next_choice[proposer]
+            if pos >= len(pref):
+                break
+            school = pref[pos]
+            next_choice[proposer] = pos + 1
+
+            rank = school_ranks[school][proposer]
+            if rank >= n_students:
+                continue
+            heap = held[school]
+            if len(heap) < capacities[school]:
+                heapq.heappush(heap, (-rank, proposer))
+                proposer = -1
+            elif heap and rank < -heap[0][0]:
+                # 替换排名最低的学生，被替换者继续申请
+                proposer = heapq.heapreplace(heap, (-rank, proposer))[1]
+
+    matching = [-1] * n_students
+    for school, heap in enumerate(held):
+        for _, student in heap:
+            matching[student] = school
+    return matching
+
+
+def da_algorithm_batch(student_prefs: "np.ndarray", school_prefs: "np.ndarray") -> "np.ndarray":
+    """批量DA算法：对B个偏好组合同时运行学生提议的DA
+
+    student_prefs 形状为 [B, n, m]，第b个实例中学生s的第k志愿为 student_prefs[b, s, k]；
+    school_prefs 形状为 [B, m, n]，要求每个学校的偏好都是全体学生的一个排列，每个学校一个名额。
+    返回形状为 [B, n] 的数组，元素为学生匹配到的学校编号，未匹配为-1，
+    与逐个调用 da_int 的结果相同。
+    """
+    if np is None:
+        raise ImportError("da_algorithm_batch 需要安装 numpy")
+    student_prefs = np.asarray(student_prefs, dtype=np.int64)
+    school_prefs = np.asarray(school_prefs, dtype=np.int64)
+    n_batch, n_students, n_schools = student_prefs.shape
+    if school_prefs.shape != (n_batch, n_schools, n_students):
+        raise ValueError(f"学校偏好的形状应为 {(n_batch, n_schools, n_students)}，"
+                         f"实际为 {school_prefs.shape}")
+
+    # 排名表：ranks[b, c, s] 为学生s在学校c偏好中的位置
+    ranks = np.empty_like(school_prefs)
+    positions = np.broadcast_to(np.arange(n_students), school_prefs.shape)
+    np.put_along_axis(ranks, school_prefs, positions, axis=2)
+
+    next_choice = np.zeros((n_batch, n_students), dtype=np.int64)
+    matched = np.zeros((n_batch, n_students), dtype=bool)
+    held = np.full((n_batch, n_schools), -1, dtype=np.int64)
+    # 空位的排名记为 n_students，任何学生都优于空位
+    held_rank = np.full((n_batch, n_schools), n_students, dtype=np.int64)
+
+    while True:
+        # 本轮所有未匹配且仍有学校可申请的学生同时提出申请
+        batch_idx, proposers = np.nonzero(~matched & (next_choice < n_schools))
+        if batch_idx.size == 0:
+            break
+        targets = student_prefs[batch_idx, proposers, next_choice[batch_idx, proposers]]
+        next_choice[batch_idx, proposers] += 1
+
+        # 每个学校在申请者和当前暂定学生中保留排名最高者
+        best_rank = held_rank.copy()
+        np.minimum.at(best_rank, (batch_idx, targets), ranks[batch_idx, targets, proposers])
+        changed_batch, changed_school = np.nonzero(best_rank < held_rank)
+
+        displaced = held[changed_batch, changed_school]
+        has_displaced = displaced != -1
+        matched[changed_batch[has_displaced], displaced[has_displaced]] = False
+
+        new_rank = best_rank[changed_batch, changed_school]
+        winners = school_prefs[changed_batch, changed_school, new_rank]
+        held[changed_batch, changed_school] = winners
+        held_rank[changed_batch, changed_school] = new_rank
+        matched[changed_batch, winners] = True
+
+    matching = np.full((n_batch, n_students), -1, dtype=np.int64)
+    held_batch, held_school = np.nonzero(held != -1)
+    matching[held_batch, held[held_batch, held_school]] = held_school
+    return matching
+
+
+class IncrementalDA:
+    """支持热启动的学生提议DA
+
+    solve 求解时记录每一次提议（学生、偏好位置、学校、被拒绝或被替换的学生）。
+    update 修改部分学生的偏好后，找到第一条在新偏好下不再成立的提议，
+    把状态回滚到它之前，然后只让此时未匹配的学生继续申请。
+    DA的结果与提议顺序无关，回滚点之前的提议在新偏好下仍然是合法的执行过程，
+    所以得到的就是新偏好下的学生最优稳定匹配。
+
+    学生按 order 的顺序依次进入市场，被替换的学生立即继续申请，
+    越晚进入的学生其提议在记录中越靠后，修改其偏好时需要回滚的部分也越少。
+    提议记录和学校的堆都只保存整数，避免在大市场中频繁触发垃圾回收。
+    """
+
+    # 提议结果：被学校拒绝（或不可接受）、被接受且没有替换任何人
+    REJECTED = -2
+    ACCEPTED = -1
+
+    def __init__(self, school_ranks: Sequence[Sequence[int]],
+                 capacities: Optional[Sequence[int]] = None):
+        self.school_ranks = school_ranks
+        self.capacities = list(capacities) if capacities is not None else [1] * len(school_ranks)
+        self.student_prefs = []
+        self.order = []
+
+    def solve(self, student_prefs: Sequence[Sequence[int]],
+              order: Optional[Sequence[int]] = None) -> List[int]:
+        """从头求解，返回每个学生匹配到的学校编号（未匹配为-1）"""
+        n_students = len(student_prefs)
+        self.student_prefs = [list(pref) for pref in student_prefs]
+        self.order = list(order) if order is not None else list(range(n_students))
+        self.next_choice = [0] * n_students
+        self.assigned = [-1] * n_students
+        # 学校 -> 堆，元素为 -(排名 * 学生数 + 学生)，堆顶为排名最低的学生
+        self.held = [[] for _ in self.school_ranks]
+        # 提议记录按字段分列保存：学生、偏好位置、学校、结果、该学生上一条提议的下标
+        self.log_student = []
+        self.log_position = []
+        self.log_school = []
+        self.log_result = []
+        self.log_previous = []
+        self.last_event = [-1] * n_students
+        self._propose(list(reversed(self.order)))
+        return list(self.assigned)
+
+    @property
+    def matching(self) -> List[int]:
+        return list(self.assigned)
+
+    def copy(self) -> "IncrementalDA":
+        """复制当前状态，用于从同一个匹配出发尝试多种偏好修改"""
+        other = IncrementalDA(self.school_ranks, self.capacities)
+        # update 只会替换偏好列表而不会修改它们，可以共享
+        other.student_prefs = list(self.student_prefs)
+        other.order = list(self.order)
+        other.next_choice = list(self.next_choice)
+        other.assigned = list(self.assigned)
+        other.held = [list(heap) for heap in self.held]
+        other.log_student = list(self.log_student)
+        other.log_position = list(self.log_position)
+        other.log_school = list(self.log_school)
+        other.log_result = list(self.log_result)
+        other.log_previous = list(self.log_previous)
+        other.last_event = list(self.last_event)
+        return other
+
+    def update(self, changes: Dict[int, Sequence[int]]) -> List[int]:
+        """修改部分学生的偏好（学生编号 -> 新偏好列表），返回新的学生最优稳定匹配"""
+        rollback_to = len(self.log_student)
+        for student, pref in changes.items():
+            pref = list(pref)
+            # 沿该学生的提议链倒序查找，保留最早一条与新偏好不符的提议
+            event = self.last_event[student]
+            while event != -1:
+                position = self.log_position[event]
+                if event < rollback_to and (position >= len(pref) or
+                                            pref[position] != self.log_school[event]):
+                    rollback_to = event
+                event = self.log_previous[event]
+            self.student_prefs[student] = pref
+
+        self._rollback(rollback_to)
+
+        # 回滚后所有未匹配且仍有学校可申请的学生继续申请
+        student_prefs, next_choice, assigned = self.student_prefs, self.next_choice, self.assigned
+        free = [student for student in reversed(self.order)
+                if assigned[student] == -1 and next_choice[student] < len(student_prefs[student])]
+        self._propose(free)
+        return list(self.assigned)
+
+    def _rollback(self, rollback_to: int):
+        """按逆序撤销 rollback_to 及之后的所有提议"""
+        held, assigned, school_ranks = self.held, self.assigned, self.school_ranks
+        n_students = len(self.student_prefs)
+        for event in range(len(self.log_student) - 1, rollback_to - 1, -1):
+            student = self.log_student[event]
+            school = self.log_school[event]
+            result = self.log_result[event]
+            self.last_event[student] = self.log_previous[event]
+            self.next_choice[student] = self.log_position[event]
+            if result == self.REJECTED:
+                continue
+            heap = held[school]
+            heap.remove(-(school_ranks[school][student] * n_students + student))
+            if result != self.ACCEPTED:
+                heap.append(-(school_ranks[school][result] * n_students + result))
+                assigned[result] = school
+            heapq.heapify(heap)
+            assigned[student] = -1
+        for column in (self.log_student, self.log_position, self.log_school,
+                       self.log_result, self.log_previous):
+            del column[rollback_to:]
+
+    def _propose(self, stack: List[int]):
+        """依次让栈中的学生申请，被替换的学生立即继续申请"""
+        student_prefs, school_ranks, capacities = self.student_prefs, self.school_ranks, self.capacities
+        next_choice, assigned, held, last_event = self.next_choice, self.assigned, self.held, self.last_event
+        log_student, log_position, log_school = self.log_student, self.log_position, self.log_school
+        log_result, log_previous = self.log_result, self.log_previous
+        n_students = len(student_prefs)
+        rejected, accepted = self.REJECTED, self.ACCEPTED
+
+        while stack:
+            proposer = stack.pop()
+            while proposer != -1:
+                pref = student_prefs[proposer]
+                pos = next_choice[proposer]
+                if pos >= len(pref):
+                    break
+                school = pref[pos]
+                next_choice[proposer] = pos + 1
+
+                rank = school_ranks[school][proposer]
+                heap = held[school]
+                if rank >= n_students:
+                    result = rejected
+                elif len(heap) < capacities[school]:
+                    heapq.heappush(heap, -(rank * n_students + proposer))
+                    result = accepted
+                elif heap and rank * n_students < -heap[0]:
+                    result = -heapq.heapreplace(heap, -(rank * n_students + proposer)) % n_students
+                else:
+                    result = rejected
+
+                log_student.append(proposer)
+                log_position.append(pos)
+                log_school.append(school)
+                log_result.append(result)
+                log_previous.append(last_event[proposer])
+                last_event[proposer] = len(log_student) - 1
+                if result == rejected:
+                    continue
+                assigned[proposer] = school
+                if result == accepted:
+                    proposer = -1
+                else:
+                    assigned[result] = -1
+                    proposer = result
@@ -0,0 +1,104 @@
+"""有利策略比例的估计和置信区间
+
+同一个案例（偏好组合）中的策略组合彼此相关，不能当作独立样本，
+所以策略组合层面的比例 Σ有利数 / Σ策略组合数 作为比率估计量，按案例聚类计算标准误差（delta方法）。
+案例层面的比例（至少有一个有利策略组合的案例占比）用 Wilson 区间。
+
+只需要按案例累计几个和，不需要保存每个案例的数据，多次运行的估计量可以直接合并。
+"""
+from math import sqrt
+from statistics import NormalDist
+from typing import Tuple
+
+
+def _z(level: float) -> float:
+    return NormalDist().inv_cdf(0.5 + level / 2)
+
+
+def wilson_interval(successes: int, n: int, level: float = 0.95) -> Tuple[float, float]:
+    """二项比例的 Wilson 置信区间，n 为0时返回 (0, 1)"""
+    if n == 0:
+        return 0.0, 1.0
+    z = _z(level)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+class RateEstimator:
+    """按案例累计策略组合数和有利策略组合数，估计有利策略比例"""
+
+    def __init__(self):
+        self.cases = 0
+        self.beneficial_cases = 0
+        self.total = 0               # Σ t_i
+        self.beneficial = 0          # Σ b_i
+        self._sum_tt = 0             # Σ t_i²
+        self._sum_bb = 0             # Σ b_i²
+        self._sum_tb = 0             # Σ t_i b_i
+
+    def add(self, total_scenarios: int, beneficial_scenarios: int):
+        """加入一个案例的策略组合数 t_i 和有利策略组合数 b_i"""
+        self.cases += 1
+        if beneficial_scenarios:
+            self.beneficial_cases += 1
+        self.total += total_scenarios
+        self.beneficial += beneficial_scenarios
+        self._sum_tt += total_scenarios * total_scenarios
+        self._sum_bb += beneficial_scenarios * beneficial_scenarios
+        self._sum_tb += total_scenarios * beneficial_scenarios
+
+    def merge(self, other: "RateEstimator"):
+        """合并另一个估计量（例如不同 seed 的重复运行）"""
+        self.cases += other.cases
+        self.beneficial_cases += other.beneficial_cases
+        self.total += other.total
+        self.beneficial += other.beneficial
+        self._sum_tt += other._sum_tt
+        self._sum_bb += other._sum_bb
+        self._sum_tb += other._sum_tb
+
+    @property
+    def rate(self) -> float:
+        return self.beneficial / self.total if self.total else 0.0
+
+    @property
+    def case_rate(self) -> float:
+        return self.beneficial_cases / self.cases if self.cases else 0.0
+
+    def standard_error(self) -> float:
+        """比率估计量按案例聚类的标准误差"""
+        if self.cases < 2 or not self.total:
+            return float('inf')
+        r = self.rate
+        # Σ (b_i - r t_i)²
+        residual = self._sum_bb - 2 * r * self._sum_tb + r * r * self._sum_tt
+        return sqrt(max(0.0, residual) * self.cases / (self.cases - 1)) / self.total
+
+    def confidence_interval(self, level: float = 0.95) -> Tuple[float, float]:
+        """有利策略比例的正态近似置信区间（截断到 [0, 1]）"""
+        half_width = _z(level) * self.standard_error()
+        return max(0.0, self.rate - half_width), min(1.0, self.rate + half_width)
+
+    def case_interval(self, level: float = 0.95) -> Tuple[float, float]:
+        """有利案例比例的 Wilson 置信区间"""
+        return wilson_interval(self.beneficial_cases, self.cases, level)
+
+    def summary(self, level: float = 0.95) -> dict:
+        low, high = self.confidence_interval(level)
+        case_low, case_high = self.case_interval(level)
+        return {
+            "cases": self.cases,
+            "total_scenarios": self.total,
+            "beneficial_scenarios": self.beneficial,
+            "rate": self.rate,
+            "ci_low": low,
+            "ci_high": high,
+            "beneficial_cases": self.beneficial_cases,
+            "case_rate": self.case_rate,
+            "case_ci_low": case_low,
+            "case_ci_high": case_high,
+            "level": level,
+        }
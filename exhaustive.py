@@ -0,0 +1,270 @@
+"""穷举模式：遍历完整的偏好空间，统计精确的有利策略比例
+
+与 run_simulation 的随机采样不同，这里遍历 s2 及之后学生的偏好和所有学校偏好的
+完整乘积，对每个偏好组合检查 s1 的全部虚假申报和其他学生的全部第二轮更新组合，
+只流式输出汇总计数，不保存案例明细。
+
+为了减少计算量：
+- 对除 s1 以外的学生重新编号（如交换 s2 和 s3）得到的偏好组合结果完全相同，
+  直接按字典序生成每个等价类中的代表元（不遍历完整的乘积），并按等价类大小加权计数；
+- DA的结果只取决于 s1 申报列表中直到其匹配学校为止的前缀，前缀相同的虚假申报直接复用结果；
+- 第二轮只通过第一轮匹配结果依赖于虚假申报，相同的第一轮匹配只计算一次第二轮。
+"""
+import json
+from datetime import datetime
+from itertools import permutations, product
+from math import prod
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from da_engine import build_rank_table, da_int
+from matching_simulation import MatchingSimulation
+
+
+def _updated_candidates(pref: Tuple[int, ...], school: int) -> List[Tuple[int, ...]]:
+    """把匹配学校移动到原位置及之前任意位置得到的所有偏好（整数版）"""
+    if school == -1:
+        return [pref]
+    position = pref.index(school)
+    rest = pref[:position] + pref[position + 1:]
+    return [rest[:new_pos] + (school,) + rest[new_pos:] for new_pos in range(position + 1)]
+
+
+class _StrategySearch:
+    """
+    一个偏好组合下 s1 各种申报的第一轮和第二轮结果（穷举模式和最优反应搜索共用）
+
+    DA的结果只取决于 s1 申报中直到其匹配学校为止的前缀，前缀相同的申报复用同一个第一轮匹配；
+    第二轮只通过第一轮匹配结果依赖于虚假申报，相同的第一轮匹配只计算一次第二轮。
+    da_calls 为实际的DA调用次数（包括诚实申报的一次）。
+    """
+
+    def __init__(self, true_pref: Tuple[int, ...], other_prefs: List[Tuple[int, ...]],
+                 ranks: List[List[int]], quota: List[int] = None):
+        self.other_prefs = other_prefs
+        self.ranks = ranks
+        self.quota = quota
+        self.honest = da_int([true_pref] + other_prefs, ranks, quota)
+        self.da_calls = 1
+        self._first_round_by_prefix = {}
+        self._remember(true_pref, self.honest)
+        self._second_round_by_matching = {}
+
+    def _remember(self, report: Tuple[int, ...], first: List[int]):
+        position = report.index(first[0]) if first[0] != -1 else len(report) - 1
+        self._first_round_by_prefix[report[:position + 1]] = first
+
+    def first_round(self, report: Tuple[int, ...]) -> List[int]:
+        """s1 申报 report 时的第一轮匹配"""
+        for length in range(1, len(report) + 1):
+            first = self._first_round_by_prefix.get(report[:length])
+            if first is not None:
+                return first
+        first = da_int([report] + self.other_prefs, self.ranks, self.quota)
+        self.da_calls += 1
+        self._remember(report, first)
+        return first
+
+    def second_round(self, first: List[int], compute: Callable[[List[int]], Tuple[Any, int]]):
+        """返回 compute(first) 的结果，compute 返回 (结果, DA调用次数)，每个不同的第一轮匹配只计算一次"""
+        key = tuple(first)
+        if key not in self._second_round_by_matching:
+            result, calls = compute(first)
+            self.da_calls += calls
+            self._second_round_by_matching[key] = result
+        return self._second_round_by_matching[key]
+
+
+def _relabelings(n_students: int, student_space: List[Tuple[int, ...]],
+                 school_space: List[Tuple[int, ...]]) -> List[Tuple[Tuple[int, ...], Dict[int, int]]]:
+    """返回保持偏好空间不变的学生重编号（固定 s1），及其在学校偏好编号上的作用"""
+    school_space_index = {pref: i for i, pref in enumerate(school_space)}
+    relabelings = []
+    for others in permutations(range(1, n_students)):
+        sigma = (0,) + others
+        school_map = {}
+        for i, pref in enumerate(school_space):
+            image = tuple(sigma[student] for student in pref)
+            if image not in school_space_index:
+                break
+            school_map[i] = school_space_index[image]
+        else:
+            relabelings.append((sigma, school_map))
+    return relabelings
+
+
+def _representatives(student_ranges: List[range], school_ranges: List[range],
+                     relabelings: List[Tuple[Tuple[int, ...], Dict[int, int]]]
+                     ) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """
+    按字典序生成每个等价类中编号最小的偏好组合（代表元）及等价类的大小
+
+    组合的前半部分为 s2 及之后学生的偏好编号，后半部分为学校偏好编号。学生部分在前，
+    所以代表元的学生部分 a 在所有重编号下最小；学校部分 b 只需要在保持 a 不变的重编号（a 的稳定子群）下最小。
+    先枚举学生部分并跳过非最小的，稳定子群只有恒等重编号时全部学校部分都是代表元，不需要逐个检查，
+    计算量与代表元的个数成正比，而不是与完整的偏好空间成正比。
+    """
+    if not relabelings:
+        for index in product(*student_ranges, *school_ranges):
+            yield index, 1
+        return
+    n_others = len(student_ranges)
+    group_size = len(relabelings)
+
+    def act(sigma, students):
+        image = [0] * n_others
+        for i in range(n_others):
+            image[sigma[i + 1] - 1] = students[i]
+        return tuple(image)
+
+    for students in product(*student_ranges):
+        images = [(act(sigma, students), school_map) for sigma, school_map in relabelings]
+        if any(image < students for image, _ in images):
+            continue
+        stabilizer = [school_map for image, school_map in images if image == students]
+        if len(stabilizer) == 1:
+            for schools in product(*school_ranges):
+                yield students + schools, group_size
+            continue
+        for schools in product(*school_ranges):
+            fixed = 0
+            for school_map in stabilizer:
+                image = tuple(school_map[q] for q in schools)
+                if image < schools:
+                    break
+                if image == schools:
+                    fixed += 1
+            else:
+                yield students + schools, group_size // fixed
+
+
+def iter_exhaustive_counts(sim: MatchingSimulation, all_prefs: Dict[str, List[List[str]]] = None,
+                           report_every: int = 10000) -> Iterator[Dict[str, int]]:
+    """遍历偏好空间，每处理 report_every 个代表元输出一次累计计数，最后输出最终计数
+
+    all_prefs 的格式与 generate_all_preferences 的返回值相同，默认使用全部排列。
+    """
+    students, schools = sim.students, sim.schools
+    n_students = len(students)
+    quota, school_index, student_index = sim._quota, sim._school_index, sim._student_index
+    if all_prefs is None:
+        all_prefs = {student: list(permutations(schools)) for student in students}
+        all_prefs.update({school: list(permutations(students)) for school in schools})
+
+    def encode_students(prefs):
+        return [tuple(school_index[school] for school in pref) for pref in prefs]
+
+    def encode_schools(prefs):
+        return [tuple(student_index[student] for student in pref) for pref in prefs]
+
+    true_pref = tuple(school_index[school] for school in sim.s1_true_pref)
+    true_rank = {school: pos for pos, school in enumerate(true_pref)}
+    false_reports = [pref for pref in encode_students(all_prefs[students[0]]) if pref != true_pref]
+    student_spaces = [encode_students(all_prefs[student]) for student in students[1:]]
+    school_spaces = [encode_schools(all_prefs[school]) for school in schools]
+
+    # 只有所有学生/学校共用同一偏好空间时才能利用重编号对称性
+    if (all(space == student_spaces[0] for space in student_spaces) and
+            all(space == school_spaces[0] for space in school_spaces)):
+        relabelings = _relabelings(n_students, student_spaces[0], school_spaces[0])
+    else:
+        relabelings = []
+
+    counts = {
+        "profiles": 0,               # 按等价类大小加权的偏好组合数
+        "representatives": 0,        # 实际计算的代表元数
+        "profiles_with_beneficial": 0,
+        "strategic_reports": 0,      # 第一轮结果与诚实情况不同的虚假申报数
+        "total_scenarios": 0,
+        "beneficial_scenarios": 0,
+        "da_calls": 0,
+    }
+    total = prod(len(space) for space in student_spaces + school_spaces)
+    n_others = n_students - 1
+
+    for index, weight in _representatives([range(len(space)) for space in student_spaces],
+                                          [range(len(space)) for space in school_spaces], relabelings):
+        other_prefs = [space[i] for space, i in zip(student_spaces, index[:n_others])]
+        school_prefs = [space[i] for space, i in zip(school_spaces, index[n_others:])]
+        ranks = build_rank_table(school_prefs, n_students)
+
+        search = _StrategySearch(true_pref, other_prefs, ranks, quota)
+        honest_rank = true_rank.get(search.honest[0], len(true_pref))
+
+        def count_second_round(first):
+            candidates = [_updated_candidates(pref, school) for pref, school in zip(other_prefs, first[1:])]
+            n_scenarios = n_beneficial = 0
+            for updated in product(*candidates):
+                second = da_int([true_pref] + list(updated), ranks, quota)
+                n_scenarios += 1
+                if true_rank.get(second[0], len(true_pref)) < honest_rank:
+                    n_beneficial += 1
+            return (n_scenarios, n_beneficial), n_scenarios
+
+        strategic_reports = scenarios = beneficial = 0
+        for report in false_reports:
+            first = search.first_round(report)
+            if first == search.honest:
+                continue
+            strategic_reports += 1
+            n_scenarios, n_beneficial = search.second_round(first, count_second_round)
+            scenarios += n_scenarios
+            beneficial += n_beneficial
+
+        counts["profiles"] += weight
+        counts["representatives"] += 1
+        counts["strategic_reports"] += weight * strategic_reports
+        counts["total_scenarios"] += weight * scenarios
+        counts["beneficial_scenarios"] += weight * beneficial
+        counts["da_calls"] += search.da_calls
+        if beneficial:
+            counts["profiles_with_beneficial"] += weight
+
+        if counts["representatives"] % report_every == 0:
+            yield dict(counts, total_profiles=total)
+
+    yield dict(counts, total_profiles=total)
+
+
+def run_exhaustive(sim: MatchingSimulation = None, all_prefs: Dict[str, List[List[str]]] = None,
+                   report_every: int = 10000):
+    """运行穷举模式，打印进度并把精确统计结果保存到JSON文件"""
+    if sim is None:
+        sim = MatchingSimulation()
+    counts = None
+    for counts in iter_exhaustive_counts(sim, all_prefs, report_every):
+        print(f"已处理 {counts['profiles']}/{counts['total_profiles']} 个偏好组合, "
+              f"有利策略组合数: {counts['beneficial_scenarios']}")
+
+    results = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "mode": "exhaustive",
+            "total_combinations": counts["total_profiles"]
+        },
+        "counts": counts,
+        "rates": {
+            "beneficial_scenario_rate": (counts["beneficial_scenarios"] / counts["total_scenarios"]
+                                         if counts["total_scenarios"] else 0.0),
+            "beneficial_profile_rate": (counts["profiles_with_beneficial"] / counts["profiles"]
+                                        if counts["profiles"] else 0.0)
+        }
+    }
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"exhaustive_results_{timestamp}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"\n穷举结果摘要:")
+    print(f"偏好组合数: {counts['profiles']}")
+    print(f"总策略组合数: {counts['total_scenarios']}")
+    print(f"有利策略组合数: {counts['beneficial_scenarios']}")
+    print(f"有利策略比例: {results['rates']['beneficial_scenario_rate']:.4%}")
+    print(f"详细结果已保存到: {filename}")
+    return results, filename
+
+
+if __name__ == "__main__":
+    sim = MatchingSimulation()
+    # 默认在 generate_all_preferences 采样出的偏好空间上穷举全部组合
+    run_exhaustive(sim, sim.generate_all_preferences())
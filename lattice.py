@@ -0,0 +1,326 @@
+"""稳定匹配格：学生最优、学校最优以及全部稳定匹配
+
+在与 da_engine 相同的整数编码上，用 Gusfield-Irving 的旋转（rotation）方法描述全部稳定匹配：
+- 学生最优匹配为学生申请的DA（da_int），学校最优匹配为学校申请的DA；
+- 从学生最优匹配出发依次消去暴露的旋转直到学校最优匹配，每个旋转恰好出现一次，
+  每个学生在自己列表上的指针只向后移动，找出全部旋转共 O(n²)；
+- 旋转偏序由旋转中的学生-学校对（第一类标记）和被旋转消去的对（第二类标记）构造，同样为 O(n²)；
+- 稳定匹配与旋转偏序的闭下集一一对应，逐个枚举下集即可得到全部稳定匹配，不需要对候选匹配重新运行DA。
+
+学校有多个名额时把每个学校拆成与名额数相同的座位（学生按顺序偏好同一学校的各个座位，
+每个座位对学生的偏好与学校相同），得到一对一的市场；拆分后的稳定匹配与原市场的稳定匹配一一对应。
+"""
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+from da_engine import build_rank_table, da_int
+from matching_simulation import MatchingSimulation
+
+
+def is_stable(matching: Sequence[int], student_prefs: Sequence[Sequence[int]],
+              school_ranks: Sequence[Sequence[int]], capacities: Sequence[int] = None) -> bool:
+    """检查学生->学校（未匹配为-1）的匹配是否稳定（个体理性且没有阻挡对）"""
+    n_students = len(student_prefs)
+    n_schools = len(school_ranks)
+    if capacities is None:
+        capacities = [1] * n_schools
+    assigned = [[] for _ in range(n_schools)]
+    for student, school in enumerate(matching):
+        if school == -1:
+            continue
+        if school not in student_prefs[student] or school_ranks[school][student] >= n_students:
+            return False
+        assigned[school].append(student)
+    if any(len(students) > capacity for students, capacity in zip(assigned, capacities)):
+        return False
+    # 每个学校接受的最差学生的排名，未满时任何可接受的学生都能形成阻挡对
+    worst = [max((school_ranks[school][student] for student in assigned[school]), default=-1)
+             if len(assigned[school]) >= capacities[school] else n_students
+             for school in range(n_schools)]
+    for student, pref in enumerate(student_prefs):
+        for school in pref:
+            if school == matching[student]:
+                break
+            if school_ranks[school][student] < worst[school]:
+                return False
+    return True
+
+
+class _SeatMarket:
+    """把有名额的学校拆成座位后的一对一市场"""
+
+    def __init__(self, student_prefs: Sequence[Sequence[int]], school_ranks: Sequence[Sequence[int]],
+                 capacities: Sequence[int] = None):
+        n_students = len(student_prefs)
+        n_schools = len(school_ranks)
+        if capacities is None:
+            capacities = [1] * n_schools
+        self.seat_school = []
+        seats_of = []
+        for school, capacity in enumerate(capacities):
+            seats_of.append(list(range(len(self.seat_school), len(self.seat_school) + capacity)))
+            self.seat_school.extend([school] * capacity)
+        self.n_students = n_students
+        self.n_seats = len(self.seat_school)
+        self.student_prefs = [[seat for school in pref for seat in seats_of[school]] for pref in student_prefs]
+        self.seat_ranks = [school_ranks[school] for school in self.seat_school]
+        # 座位按学校的偏好排列的可接受学生，以及学生对座位的排名
+        self.seat_prefs = [sorted((student for student in range(n_students) if ranks[student] < n_students),
+                                  key=ranks.__getitem__)
+                           for ranks in self.seat_ranks]
+        self.student_ranks = build_rank_table(self.student_prefs, self.n_seats)
+
+
+class StableLattice:
+    """
+    一个偏好组合下全部稳定匹配构成的格
+
+    student_prefs 为学生对学校编号的偏好列表（可以不完整），school_ranks 为 build_rank_table 的结果。
+    内部在座位市场上计算，对外的匹配结果都是学生->学校的列表（未匹配为-1）。
+    """
+
+    def __init__(self, student_prefs: Sequence[Sequence[int]], school_ranks: Sequence[Sequence[int]],
+                 capacities: Sequence[int] = None):
+        market = _SeatMarket(student_prefs, school_ranks, capacities)
+        self._market = market
+
+        # 学生最优和学校（座位）最优匹配，均为学生->座位
+        self._student_optimal = da_int(market.student_prefs, market.seat_ranks)
+        seat_matching = da_int(market.seat_prefs, market.student_ranks)
+        self._school_optimal = [-1] * market.n_students
+        for seat, student in enumerate(seat_matching):
+            if student != -1:
+                self._school_optimal[student] = seat
+
+        self.rotations: List[List[Tuple[int, int]]] = []   # 每个旋转为 [(学生, 座位), ...]
+        self.predecessors: List[Set[int]] = []             # 旋转偏序中的直接前驱（传递约简前）
+        self._find_rotations()
+        self._build_poset()
+
+    # ---- 旋转 ----
+
+    def _find_rotations(self):
+        market = self._market
+        prefs, seat_ranks = market.student_prefs, market.seat_ranks
+        n_students = market.n_students
+        start, end = self._student_optimal, self._school_optimal
+        partner = list(start)                      # 学生 -> 当前座位
+        holder = [-1] * market.n_seats             # 座位 -> 当前学生
+        for student, seat in enumerate(partner):
+            if seat != -1:
+                holder[seat] = student
+        # 学校最优匹配中座位得到的学生（座位能得到的最好的稳定伴侣）
+        best_rank = [n_students] * market.n_seats
+        for student, seat in enumerate(end):
+            if seat != -1:
+                best_rank[seat] = seat_ranks[seat][student]
+        last = [pref.index(seat) if seat != -1 else -1 for pref, seat in zip(prefs, end)]
+        # 学生在列表上的指针只向后移动：被跳过的座位此后一直偏好其当前学生或超出了稳定范围
+        pointer = [pref.index(seat) + 1 if seat != -1 else 0 for pref, seat in zip(prefs, start)]
+        self._rotation_pairs = {}                  # (学生, 座位) -> 旋转编号（第一类标记）
+        self._eliminated = {}                      # (学生, 座位) -> 旋转编号（第二类标记）
+
+        def successor(student):
+            """当前匹配中学生列表上第一个更偏好该学生、且该学生不优于其最好稳定伴侣的座位"""
+            pref = prefs[student]
+            k = pointer[student]
+            while k <= last[student]:
+                seat = pref[k]
+                rank = seat_ranks[seat][student]
+                if best_rank[seat] <= rank < seat_ranks[seat][holder[seat]]:
+                    break
+                k += 1
+            pointer[student] = k
+            return pref[k]
+
+        path = []
+        on_path = [False] * n_students
+        for first in range(n_students):
+            # 起点学生本身可能在旋转中移动，需要一直继续到它到达学校最优匹配中的座位
+            while partner[first] != end[first]:
+                path.append(first)
+                on_path[first] = True
+                while path:
+                    student = path[-1]
+                    following = holder[successor(student)]
+                    if not on_path[following]:
+                        path.append(following)
+                        on_path[following] = True
+                        continue
+                    # 找到一个暴露的旋转：path 中从 following 开始的后缀
+                    cycle_start = len(path) - 1
+                    while path[cycle_start] != following:
+                        cycle_start -= 1
+                    cycle = path[cycle_start:]
+                    del path[cycle_start:]
+                    for member in cycle:
+                        on_path[member] = False
+                    # path 的其余部分不受影响（其中学生的 successor 对应的座位伴侣没有改变）
+                    self._eliminate(cycle, partner, holder, pointer, prefs)
+
+    def _eliminate(self, cycle: List[int], partner: List[int], holder: List[int],
+                   pointer: List[int], prefs: List[List[int]]):
+        market = self._market
+        index = len(self.rotations)
+        rotation = [(student, partner[student]) for student in cycle]
+        self.rotations.append(rotation)
+        new_seats = [prefs[student][pointer[student]] for student in cycle]
+        for (student, seat), new_seat in zip(rotation, new_seats):
+            self._rotation_pairs[student, seat] = index
+        for i, (student, seat) in enumerate(rotation):
+            # seat 的新伴侣为 cycle 中的前一个学生，排名在两者之间的学生与 seat 的配对被消去
+            new_holder = cycle[i - 1]
+            ranks = market.seat_ranks[seat]
+            low, high = ranks[new_holder], ranks[student]
+            for other in market.seat_prefs[seat][low + 1:high]:
+                self._eliminated[other, seat] = index
+        for student, new_seat in zip(cycle, new_seats):
+            partner[student] = new_seat
+            holder[new_seat] = student
+            pointer[student] += 1
+
+    def _build_poset(self):
+        """按每个学生的列表顺序扫描第一类和第二类标记，得到旋转偏序的生成关系"""
+        market = self._market
+        self.predecessors = [set() for _ in self.rotations]
+        for student, pref in enumerate(market.student_prefs):
+            if self._student_optimal[student] == -1:
+                continue
+            first = pref.index(self._student_optimal[student])
+            last = pref.index(self._school_optimal[student])
+            previous = None
+            for seat in pref[first:last + 1]:
+                rotation = self._rotation_pairs.get((student, seat))
+                if rotation is not None:
+                    # 同一学生依次参与的旋转
+                    if previous is not None:
+                        self.predecessors[rotation].add(previous)
+                    previous = rotation
+                    continue
+                eliminating = self._eliminated.get((student, seat))
+                if eliminating is not None and previous is not None and eliminating != previous:
+                    # 学生越过 seat 之前，seat 必须已经被消去
+                    self.predecessors[previous].add(eliminating)
+
+    # ---- 结果 ----
+
+    def _to_schools(self, seat_matching: Sequence[int]) -> List[int]:
+        seat_school = self._market.seat_school
+        return [seat_school[seat] if seat != -1 else -1 for seat in seat_matching]
+
+    @property
+    def student_optimal(self) -> List[int]:
+        return self._to_schools(self._student_optimal)
+
+    @property
+    def school_optimal(self) -> List[int]:
+        return self._to_schools(self._school_optimal)
+
+    def stable_schools(self, student: int) -> Set[int]:
+        """学生在某个稳定匹配中可能得到的全部学校（未匹配的学生在所有稳定匹配中都未匹配，返回空集）"""
+        seat_school = self._market.seat_school
+        if self._student_optimal[student] == -1:
+            return set()
+        schools = {seat_school[self._student_optimal[student]]}
+        for rotation in self.rotations:
+            for i, (member, _) in enumerate(rotation):
+                if member == student:
+                    schools.add(seat_school[rotation[(i + 1) % len(rotation)][1]])
+        return schools
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """逐个生成全部稳定匹配（学生->学校），每个闭下集对应一个匹配"""
+        order = self._topological_order()
+        n = len(order)
+        included = [False] * len(self.rotations)
+        partner = list(self._student_optimal)
+
+        def visit(k):
+            if k == n:
+                yield self._to_schools(partner)
+                return
+            rotation = order[k]
+            yield from visit(k + 1)
+            if all(included[p] for p in self.predecessors[rotation]):
+                pairs = self.rotations[rotation]
+                saved = [partner[student] for student, _ in pairs]
+                for i, (student, _) in enumerate(pairs):
+                    partner[student] = pairs[(i + 1) % len(pairs)][1]
+                included[rotation] = True
+                yield from visit(k + 1)
+                included[rotation] = False
+                for (student, _), seat in zip(pairs, saved):
+                    partner[student] = seat
+
+        return visit(0)
+
+    def _topological_order(self) -> List[int]:
+        # 旋转按被找到的顺序已经满足偏序（沿一条极大链依次消去）
+        return list(range(len(self.rotations)))
+
+    def count(self) -> int:
+        return sum(1 for _ in self)
+
+
+def build_lattice(sim: MatchingSimulation, student_prefs: Dict[str, List[str]],
+                  school_prefs: Dict[str, List[str]]) -> StableLattice:
+    """按 sim 的学生和学校编号构造一个偏好组合的稳定匹配格"""
+    school_index = {school: i for i, school in enumerate(sim.schools)}
+    student_index = {student: i for i, student in enumerate(sim.students)}
+    encoded = [[school_index[school] for school in student_prefs[student]] for student in sim.students]
+    ranks = build_rank_table([[student_index[student] for student in school_prefs[school]]
+                              for school in sim.schools], len(sim.students))
+    return StableLattice(encoded, ranks, sim.capacities)
+
+
+def school_optimal_matching(sim: MatchingSimulation, student_prefs: Dict[str, List[str]],
+                            school_prefs: Dict[str, List[str]]) -> Dict[str, str]:
+    """学校申请的DA的结果（学校最优稳定匹配），格式与 da_algorithm 相同"""
+    return sim._decode_matching(build_lattice(sim, student_prefs, school_prefs).school_optimal)
+
+
+def stable_matchings(sim: MatchingSimulation, student_prefs: Dict[str, List[str]],
+                     school_prefs: Dict[str, List[str]]) -> List[Dict[str, str]]:
+    """全部稳定匹配，第一个为学生最优匹配（数目可能随市场规模指数增长，只用于小市场）"""
+    return [sim._decode_matching(matching) for matching in build_lattice(sim, student_prefs, school_prefs)]
+
+
+def check_beneficial_outcomes(sim: MatchingSimulation, case_data: dict) -> List[dict]:
+    """
+    对案例中每个有利的第二轮结果，检查它相对于真实偏好（initial_setup）下稳定匹配集合的位置
+
+    返回每个有利结果一项：s1 得到的学校是否属于 s1 的稳定学校集合（s1_in_stable_set），
+    整个第二轮匹配在真实偏好下是否稳定（matching_stable），以及得到的学校不在自己稳定学校集合中的学生。
+    只需要构造一次稳定匹配格，不需要枚举稳定匹配。
+    """
+    setup = case_data["initial_setup"]
+    lattice = build_lattice(sim, setup["student_preferences"], setup["school_preferences"])
+    school_index = {school: i for i, school in enumerate(sim.schools)}
+    student_index = {student: i for i, student in enumerate(sim.students)}
+    stable_sets = {student: {sim.schools[school] for school in lattice.stable_schools(i)}
+                   for student, i in student_index.items()}
+    encoded_prefs = [[school_index[school] for school in setup["student_preferences"][student]]
+                     for student in sim.students]
+    ranks = build_rank_table([[student_index[student] for student in setup["school_preferences"][school]]
+                              for school in sim.schools], len(sim.students))
+    s1 = sim.students[0]
+
+    results = []
+    for strategy in case_data["strategic_scenarios"]:
+        for second_round in strategy["second_round_scenarios"]:
+            if not second_round["outcome"]["is_beneficial"]:
+                continue
+            matching = second_round["matching"]
+            encoded = [school_index[matching[student]] if student in matching else -1
+                       for student in sim.students]
+            # 未匹配的学生在所有稳定匹配中都未匹配时视为在稳定集合中
+            outside = [student for student in sim.students
+                       if (matching[student] not in stable_sets[student] if student in matching
+                           else bool(stable_sets[student]))]
+            results.append({
+                "false_preference": strategy["false_preference"],
+                "updated_preferences": second_round["updated_preferences"],
+                "s1_in_stable_set": s1 not in outside,
+                "matching_stable": is_stable(encoded, encoded_prefs, ranks, sim.capacities),
+                "students_outside_stable_set": outside
+            })
+    return results
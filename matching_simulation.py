@@ -1,83 +1,259 @@
-from itertools import permutations
-from typing import List, Dict, Tuple, Set
+import random
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional, Sequence, Tuple, Set
+
+from da_engine import IncrementalDA, build_rank_table, da_algorithm_batch, da_int
+from preference_space import get_update_table, sample_permutations
+from tracing import ConsoleSink, traced_da
 
 class MatchingSimulation:
-    def __init__(self):
-        self.students = ['s1', 's2', 's3', 's4']
-        self.schools = ['c1', 'c2', 'c3', 'c4']
-        self.s1_true_pref = ['c1', 'c2', 'c3', 'c4']
+    def __init__(self, n_students: int = 4, n_schools: int = 4, capacities: List[int] = None):
+        """
+        创建 n_students 个学生（s1..sn）和 n_schools 个学校（c1..cm）的市场
+
+        capacities 为各学校的名额，默认每个学校一个名额。
+        """
+        if n_students < 1 or n_schools < 1:
+            raise ValueError("学生数和学校数必须为正数")
+        if capacities is None:
+            capacities = [1] * n_schools
+        if len(capacities) != n_schools or any(capacity < 0 for capacity in capacities):
+            raise ValueError(f"名额向量应为 {n_schools} 个非负整数: {capacities}")
+        
+        self.students = [f's{i + 1}' for i in range(n_students)]
+        self.schools = [f'c{i + 1}' for i in range(n_schools)]
+        self.capacities = list(capacities)
+        self.s1_true_pref = list(self.schools)
+        # 全部为单名额时使用更快的单名额引擎
+        self._quota = None if all(capacity == 1 for capacity in self.capacities) else self.capacities
         
-        # 添加调试标志
-        self.debug = False
+        # 学生/学校名称到整数编号的映射，供整数DA引擎使用
+        self._student_index = {student: i for i, student in enumerate(self.students)}
+        self._school_index = {school: i for i, school in enumerate(self.schools)}
+        # 最近一次使用的学校偏好及其排名表（同一案例中学校偏好会被反复使用）
+        self._rank_table_key = None
+        self._rank_table = None
+        
+        # 追踪事件的 sink（见 tracing），为空时不记录任何调试信息
+        self.trace = None
+        # DA引擎: 'rank' 为整数排名表引擎，'legacy' 为原始的字符串/列表实现
+        self.engine = 'rank'
+        # DA结果的LRU缓存，默认关闭（见 enable_cache）
+        # 键和值都编码为整数编号的 bytes，每个编号占用的字节数取决于市场规模；
+        # 分隔符取任何学生或学校都不会用到的编号
+        separator = max(n_students, n_schools)
+        self._cache_typecode = 'B' if separator < 2 ** 8 else 'H' if separator < 2 ** 16 else 'I'
+        self._cache_separator = array(self._cache_typecode, [separator]).tobytes()
+        self._cache = None
+        self._cache_maxsize = 0
+        self._cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # 分阶段计时（见 profiling.SimulationProfiler），默认关闭
+        self.profiler = None
+        # 第二轮偏好更新的编号表，同一组学校的所有实例共用
+        self._update_table = get_update_table(self.schools)
         
     def set_debug(self, debug: bool):
-        """设置调试模式"""
-        self.debug = debug
-        
-    def generate_all_preferences(self) -> Dict[str, List[List[str]]]:
-        """生成限制数量的偏好排列"""
-        # 学生的偏好（对学校的排序）
-        school_perms = list(permutations(self.schools))
-        max_school_perms = 6  # 限制学校排列数量
-        
-        # 学校的偏好（对学生的排序）
-        student_perms = list(permutations(self.students))
-        max_student_perms = 6  # 限制学生排列数量
-        
-        import random
-        # 为学生采样学校的排序
-        sampled_school_perms = random.sample(school_perms, min(max_school_perms, len(school_perms)))
+        """设置调试模式，把追踪事件以文字打印到控制台"""
+        self.set_trace(ConsoleSink() if debug else None)
+        
+    def set_trace(self, sink):
+        """设置接收追踪事件的 sink（如 tracing.RingBufferSink、tracing.FileSink），为空时关闭追踪"""
+        self.trace = sink
+        
+    def set_profiler(self, profiler):
+        """设置记录DA求解和偏好更新耗时的 profiler，为空时关闭计时"""
+        self.profiler = profiler
+        
+    @property
+    def debug(self) -> bool:
+        return self.trace is not None
+        
+    @debug.setter
+    def debug(self, debug: bool):
+        self.set_debug(debug)
+        
+    def set_engine(self, engine: str):
+        """选择DA引擎（'rank' 或 'legacy'）"""
+        if engine not in ('rank', 'legacy'):
+            raise ValueError(f"未知的DA引擎: {engine}")
+        self.engine = engine
+        
+    def enable_cache(self, maxsize: int = 100000):
+        """启用有界的DA结果LRU缓存，maxsize 为0时关闭缓存
+
+        缓存属于实例，多进程运行时每个进程各自持有一个缓存。
+        """
+        self._cache = OrderedDict() if maxsize > 0 else None
+        self._cache_maxsize = maxsize
+        self._cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        
+    def cache_info(self) -> Dict[str, int]:
+        """返回缓存的命中、未命中、淘汰次数及当前大小"""
+        size = len(self._cache) if self._cache is not None else 0
+        return dict(self._cache_stats, size=size, maxsize=self._cache_maxsize)
+        
+    def generate_all_preferences(self, rng: random.Random = None, max_school_perms: int = 6, 
+                                 max_student_perms: int = 6) -> Dict[str, List[List[str]]]:
+        """
+        生成限制数量的偏好排列，rng 为空时使用全局的 random 模块
+
+        max_school_perms 限制学生偏好（对学校的排序）的数量，
+        max_student_perms 限制学校偏好（对学生的排序）的数量。
+        """
+        if rng is None:
+            rng = random
+            
+        # 为学生采样学校的排序（不枚举全部排列）
+        sampled_school_perms = sample_permutations(self.schools, max_school_perms, rng)
         # 为学校采样学生的排序
-        sampled_student_perms = random.sample(student_perms, min(max_student_perms, len(student_perms)))
+        sampled_student_perms = sample_permutations(self.students, max_student_perms, rng)
             
-        result = {
-            # 学生的偏好
-            's1': sampled_school_perms,
-            's2': sampled_school_perms,
-            's3': sampled_school_perms,
-            's4': sampled_school_perms,
-            # 学校的偏好
-            'c1': sampled_student_perms,
-            'c2': sampled_student_perms,
-            'c3': sampled_student_perms,
-            'c4': sampled_student_perms
-        }
-        
-        if self.debug:
-            print("生成的偏好样本:")
-            print("学生对学校的偏好样本:", sampled_school_perms[0])
-            print("学校对学生的偏好样本:", sampled_student_perms[0])
+        # 学生的偏好
+        result = {student: sampled_school_perms for student in self.students}
+        # 学校的偏好
+        result.update({school: sampled_student_perms for school in self.schools})
+        
+        if self.trace is not None:
+            self.trace.emit({"event": "preferences_sampled", 
+                             "student_perms": [list(perm) for perm in sampled_school_perms],
+                             "school_perms": [list(perm) for perm in sampled_student_perms]})
         
         return result
         
     def da_algorithm(self, student_prefs: Dict[str, List[str]], 
                     school_prefs: Dict[str, List[str]]) -> Dict[str, str]:
         """实现DA算法"""
+        if self.profiler is None:
+            return self._da_algorithm(student_prefs, school_prefs)
+        start = time.perf_counter()
+        matching = self._da_algorithm(student_prefs, school_prefs)
+        self.profiler.record_da(time.perf_counter() - start, student_prefs, matching)
+        return matching
+        
+    def _da_algorithm(self, student_prefs: Dict[str, List[str]], 
+                      school_prefs: Dict[str, List[str]]) -> Dict[str, str]:
+        # 追踪时使用单独的逐轮记录事件的引擎，且不走缓存
+        if self.trace is not None:
+            return traced_da(self.students, self.schools, self.capacities, 
+                             student_prefs, school_prefs, self.trace)
+        if self._cache is None:
+            return self._solve(student_prefs, school_prefs)
+        
+        # 以偏好组合的紧凑编码作为键，重复出现的偏好组合不再重新计算
+        key = self._profile_key(student_prefs, school_prefs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._cache_stats["hits"] += 1
+            encoded = array(self._cache_typecode)
+            encoded.frombytes(cached)
+            return self._decode_matching([school - 1 for school in encoded])
+        
+        self._cache_stats["misses"] += 1
+        result = self._solve(student_prefs, school_prefs)
+        school_index = self._school_index
+        self._cache[key] = array(self._cache_typecode, 
+                                 [school_index[result[student]] + 1 if student in result else 0
+                                  for student in self.students]).tobytes()
+        if len(self._cache) > self._cache_maxsize:
+            self._cache.popitem(last=False)
+            self._cache_stats["evictions"] += 1
+        return result
+        
+    def _profile_key(self, student_prefs: Dict[str, List[str]], 
+                     school_prefs: Dict[str, List[str]]) -> bytes:
+        """偏好组合的紧凑编码：每个偏好列表写成整数编号，列表之间用分隔符隔开"""
+        school_code = self._school_index.__getitem__
+        student_code = self._student_index.__getitem__
+        if self._cache_typecode == 'B':
+            encode = lambda codes: bytes(codes)
+        else:
+            encode = lambda codes: array(self._cache_typecode, codes).tobytes()
+        return self._cache_separator.join(
+            [encode(map(school_code, student_prefs[student])) for student in self.students] + 
+            [encode(map(student_code, school_prefs[school])) for school in self.schools])
+        
+    def _solve(self, student_prefs: Dict[str, List[str]], 
+               school_prefs: Dict[str, List[str]]) -> Dict[str, str]:
+        """用当前选择的引擎求解一次DA"""
+        if self.engine == 'legacy':
+            return self._da_algorithm_legacy(student_prefs, school_prefs)
+        
+        school_index = self._school_index
+        encoded_prefs = [[school_index[school] for school in student_prefs[student]]
+                         for student in self.students]
+        matching = da_int(encoded_prefs, self._school_rank_table(school_prefs), self._quota)
+        return self._decode_matching(matching)
+        
+    def _decode_matching(self, matching: List[int]) -> Dict[str, str]:
+        """把整数匹配结果转换为字典，按学校顺序输出，与原始实现的结果顺序一致"""
+        matched = sorted((school, student) for student, school in enumerate(matching) 
+                         if school != -1)
+        return {self.students[student]: self.schools[school] for school, student in matched}
+        
+    def warm_start(self, student_prefs: Dict[str, List[str]], 
+                   school_prefs: Dict[str, List[str]], 
+                   last: List[str] = None) -> "IncrementalMatching":
+        """
+        求解一次DA并保留求解过程，之后可以用 update 增量地修改部分学生的偏好
+
+        last 中的学生最后进入市场（默认为s1），修改这些学生的偏好时需要重算的部分最少。
+        """
+        if last is None:
+            last = self.students[:1]
+        order = [student for student in self.students if student not in last] + list(last)
+        school_index = self._school_index
+        solver = IncrementalDA(self._school_rank_table(school_prefs), self.capacities)
+        solver.solve([[school_index[school] for school in student_prefs[student]]
+                      for student in self.students],
+                     [self._student_index[student] for student in order])
+        return IncrementalMatching(self, solver)
+        
+    def da_algorithm_batch(self, student_prefs_list: List[Dict[str, List[str]]], 
+                           school_prefs_list: List[Dict[str, List[str]]]) -> List[Dict[str, str]]:
+        """批量运行DA算法（需要numpy），偏好必须是完整排列，且每个学校只有一个名额"""
+        if self._quota is not None:
+            raise ValueError("批量DA引擎只支持单名额的学校")
+        school_index = self._school_index
+        student_index = self._student_index
+        encoded_students = [[[school_index[school] for school in student_prefs[student]]
+                             for student in self.students]
+                            for student_prefs in student_prefs_list]
+        encoded_schools = [[[student_index[student] for student in school_prefs[school]]
+                            for school in self.schools]
+                           for school_prefs in school_prefs_list]
+        matchings = da_algorithm_batch(encoded_students, encoded_schools)
+        
+        return [self._decode_matching(matching) for matching in matchings.tolist()]
+        
+    def _school_rank_table(self, school_prefs: Dict[str, List[str]]) -> List[List[int]]:
+        """返回学校偏好的排名表，同一组学校偏好只计算一次"""
+        key = tuple(tuple(school_prefs[school]) for school in self.schools)
+        if key != self._rank_table_key:
+            student_index = self._student_index
+            encoded = [[student_index[student] for student in pref] for pref in key]
+            self._rank_table = build_rank_table(encoded, len(self.students))
+            self._rank_table_key = key
+        return self._rank_table
+        
+    def _da_algorithm_legacy(self, student_prefs: Dict[str, List[str]], 
+                             school_prefs: Dict[str, List[str]]) -> Dict[str, str]:
+        """原始的DA算法实现（逐轮处理），带追踪的版本见 tracing.traced_da"""
         unmatched_students = self.students.copy()
-        school_matches = {school: None for school in self.schools}
+        capacities = dict(zip(self.schools, self.capacities))
+        school_matches = {school: [] for school in self.schools}
         student_proposals = {student: 0 for student in self.students}
         
-        if self.debug:
-            print("\n开始DA算法匹配过程:")
-            print(f"初始学生偏好: {student_prefs}")
-            print(f"学校偏好: {school_prefs}")
-            
-        round_num = 1
         while unmatched_students:
-            if self.debug:
-                print(f"\n第{round_num}轮匹配:")
-                print(f"未匹配学生: {unmatched_students}")
-                print(f"当前学校匹配情况: {school_matches}")
-            
             # 收集本轮所有未匹配学生的申请
             current_proposals = {}  # school -> [students]
             students_to_remove = []
             
             for student in unmatched_students:
                 # 如果学生已申请完所有学校，则加入待移除列表
-                if student_proposals[student] >= len(self.schools):
-                    if self.debug:
-                        print(f"{student}已申请完所有学校")
+                if student_proposals[student] >= len(student_prefs[student]):
                     students_to_remove.append(student)
                     continue
                     
@@ -87,9 +263,6 @@ class MatchingSimulation:
                 if school not in current_proposals:
                     current_proposals[school] = []
                 current_proposals[school].append(student)
-                
-                if self.debug:
-                    print(f"{student}申请{school}")
             
             # 移除已申请完所有学校的学生
             for student in students_to_remove:
@@ -98,62 +271,91 @@ class MatchingSimulation:
             # 处理每个学校收到的申请
             for school, applicants in current_proposals.items():
                 # 将当前匹配的学生也加入考虑
-                if school_matches[school] is not None:
-                    applicants.append(school_matches[school])
+                current_matches = school_matches[school]
+                applicants.extend(current_matches)
                 
                 # 按照学校偏好对申请者排序
                 applicants.sort(key=lambda x: school_prefs[school].index(x))
                 
-                # 选择最优的申请者
-                best_applicant = applicants[0]
+                # 在名额内选择最优的申请者
+                accepted = applicants[:capacities[school]]
                 
-                if best_applicant != school_matches[school]:
-                    # 如果当前匹配的学生被替换，将其重新加入未匹配列表
-                    if school_matches[school] is not None:
-                        if self.debug:
-                            print(f"{school}接受{best_applicant}, 拒绝{school_matches[school]}")
-                        unmatched_students.append(school_matches[school])
-                    else:
-                        if self.debug:
-                            print(f"{school}接受{best_applicant}")
-                            
-                    school_matches[school] = best_applicant
-                    unmatched_students.remove(best_applicant)
+                for best_applicant in accepted:
+                    if best_applicant not in current_matches:
+                        unmatched_students.remove(best_applicant)
                 
-                # 拒绝其他申请者
-                for rejected_student in applicants[1:]:
-                    if rejected_student != school_matches[school]:
-                        if self.debug:
-                            print(f"{school}拒绝{rejected_student}")
-                            
-            round_num += 1
+                # 拒绝其他申请者，被替换的已匹配学生重新加入未匹配列表
+                for rejected_student in applicants[len(accepted):]:
+                    if rejected_student in current_matches:
+                        unmatched_students.append(rejected_student)
+                        
+                school_matches[school] = accepted
                     
-        final_matching = {student: school for school, student in school_matches.items()}
-        if self.debug:
-            print("\n最终匹配结果:", final_matching)
-        return final_matching
+        return {student: school for school in self.schools 
+                for student in sorted(school_matches[school], key=self._student_index.get)}
         
     def generate_updated_preferences(self, first_round_matching: Dict[str, str], 
                                    original_prefs: Dict[str, List[str]]) -> Dict[str, List[List[str]]]:
         """生成第二轮可能的偏好更新"""
-        updated_prefs = {}
+        if self.profiler is None:
+            return self._generate_updated_preferences(first_round_matching, original_prefs)
+        start = time.perf_counter()
+        updated_prefs = self._generate_updated_preferences(first_round_matching, original_prefs)
+        self.profiler.add("updates", time.perf_counter() - start)
+        return updated_prefs
+        
+    def preference_indices(self, prefs: Sequence[Sequence[str]]) -> Optional[List[int]]:
+        """更新表已填满时返回各偏好（对学校的排列）的排列编号，供 sample_updated_preferences 查表，否则返回 None"""
+        table = self._update_table
+        if not table.complete:
+            return None
+        return [table.index(pref) for pref in prefs]
+        
+    def sample_updated_preferences(self, first_round_matching: Dict[str, str], 
+                                   original_prefs: Dict[str, List[str]], k: int, 
+                                   rng: random.Random, 
+                                   pref_indices: List[int] = None) -> Dict[str, List[List[str]]]:
+        """
+        为s1以外的每个学生不重复地采样最多 k 种第二轮偏好更新
+
+        依次对每个学生调用 rng.sample，结果与从 generate_updated_preferences 的候选列表中采样完全相同，
+        但不生成完整的候选列表。pref_indices 为这些学生原偏好的排列编号（见 preference_indices），
+        给出时直接按编号查更新表；否则只构造被选中的更新。
+        """
+        start = time.perf_counter() if self.profiler is not None else None
+        table = self._update_table
+        others = self.students[1:]
+        if pref_indices is not None:
+            matched = [first_round_matching.get(student) for student in others]
+            sampled = dict(zip(others, table.sample_update_lists(pref_indices, matched, k, rng)))
+        else:
+            sampled = {student: table.sample_perms(original_prefs[student], 
+                                                   first_round_matching.get(student), k, rng)
+                       for student in others}
+        if self.trace is not None:
+            for student in others:
+                matched_school = first_round_matching.get(student)
+                self.trace.emit({"event": "updated_preferences", "student": student, 
+                                 "matched_school": matched_school, 
+                                 "options": table.update_perms(original_prefs[student], matched_school)})
+        if start is not None:
+            self.profiler.add("updates", time.perf_counter() - start)
+        return sampled
         
-        if self.debug:
-            print("\n生成更新后的偏好:")
-            print(f"第一轮匹配结果: {first_round_matching}")
-            print(f"原始偏好: {original_prefs}")
+    def _generate_updated_preferences(self, first_round_matching: Dict[str, str], 
+                                      original_prefs: Dict[str, List[str]]) -> Dict[str, List[List[str]]]:
+        updated_prefs = {}
             
-        for student in ['s2', 's3', 's4']:
-            matched_school = first_round_matching[student]
+        for student in self.students[1:]:
+            matched_school = first_round_matching.get(student)
             # 将元组转换为列表
             original_pref = list(original_prefs[student])
+            if matched_school is None:
+                # 第一轮未匹配的学生没有可以提前的学校
+                updated_prefs[student] = [original_pref]
+                continue
             matched_school_index = original_pref.index(matched_school)
             
-            if self.debug:
-                print(f"\n处理{student}的偏好更新:")
-                print(f"匹配到的学校: {matched_school}")
-                print(f"原始偏好中的位置: {matched_school_index}")
-            
             # 生成所有可能的更新偏好
             possible_prefs = []
             
@@ -168,15 +370,39 @@ class MatchingSimulation:
                 
             updated_prefs[student] = possible_prefs
             
-            if self.debug:
-                print(f"{student}可能的更新偏好: {updated_prefs[student]}")
-                print(f"总共{len(updated_prefs[student])}种可能的更新")
+        if self.trace is not None:
+            for student, options in updated_prefs.items():
+                self.trace.emit({"event": "updated_preferences", "student": student, 
+                                 "matched_school": first_round_matching.get(student), 
+                                 "options": options})
             
         return updated_prefs
     
+class IncrementalMatching:
+    """热启动的DA求解器的字典接口，由 MatchingSimulation.warm_start 创建"""
+    
+    def __init__(self, sim: MatchingSimulation, solver: IncrementalDA):
+        self.sim = sim
+        self.solver = solver
+        
+    @property
+    def matching(self) -> Dict[str, str]:
+        return self.sim._decode_matching(self.solver.matching)
+        
+    def update(self, changed_prefs: Dict[str, List[str]]) -> Dict[str, str]:
+        """修改部分学生的偏好，返回新的DA匹配结果"""
+        school_index = self.sim._school_index
+        changes = {self.sim._student_index[student]: [school_index[school] for school in pref]
+                   for student, pref in changed_prefs.items()}
+        return self.sim._decode_matching(self.solver.update(changes))
+        
+    def copy(self) -> "IncrementalMatching":
+        """复制当前状态，用于从同一个匹配出发尝试多种偏好修改"""
+        return IncrementalMatching(self.sim, self.solver.copy())
+    
 if __name__ == '__main__':
     # 创建实例并启用调试
-    sim = MatchingSimulation()
+    sim = MatchingSimulation(n_students=3, n_schools=3)
     sim.set_debug(True)  # 打开调试模式
 
     # 测试生成偏好
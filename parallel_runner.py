@@ -0,0 +1,122 @@
+"""多进程分片模拟
+
+把采样出的偏好组合按案例编号切分为固定数量的分片，在进程池中执行，
+再按案例编号合并为与 run_simulation 相同的 simulation_data。
+每个案例使用由 (seed, case_index) 决定的随机数生成器，分片数固定，
+所以相同 seed 下结果与进程数无关，并且与单进程的 run_simulation 完全一致。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from best_response import check_report_space
+from matching_simulation import MatchingSimulation
+from run_matching import (analyze_results, count_scenarios, evaluate_case, prepare_simulation,
+                          save_all_beneficial_cases, save_first_beneficial_case,
+                          save_simulation_data)
+
+# 每个工作进程为每种市场规模复用一个 MatchingSimulation 实例（及其DA结果缓存）
+_worker_sims = {}
+
+
+def _get_worker_sim(market: Tuple[int, int, Tuple[int, ...]], cache_size: int) -> MatchingSimulation:
+    if market not in _worker_sims:
+        n_students, n_schools, capacities = market
+        sim = MatchingSimulation(n_students, n_schools, list(capacities))
+        sim.enable_cache(cache_size)
+        _worker_sims[market] = sim
+    return _worker_sims[market]
+
+
+def _run_shard(task: Tuple) -> List[Tuple]:
+    """
+    按顺序执行一个分片中的案例，分片内找到 max_cases 个有利案例后停止
+
+    返回 [(case_index, 策略组合数, 有利策略组合数, 有利案例数据或None), ...]
+    """
+    (seed, start_index, combinations, all_prefs, max_cases, cache_size, market, search,
+     n_false_reports, max_updates_per_student) = task
+    sim = _get_worker_sim(market, cache_size)
+    results = []
+    found = 0
+    for offset, combination in enumerate(combinations):
+        if found >= max_cases:
+            break
+        case_index = start_index + offset
+        case_data = evaluate_case(sim, case_index, combination, all_prefs, seed, search,
+                                  n_false_reports, max_updates_per_student)
+        n_scenarios, n_beneficial = count_scenarios(case_data)
+        if n_beneficial:
+            found += 1
+            results.append((case_index, n_scenarios, n_beneficial, case_data))
+        else:
+            results.append((case_index, n_scenarios, n_beneficial, None))
+    return results
+
+
+def merge_shard_results(shard_results: List[List[Tuple]], max_cases: int) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    按案例编号合并分片结果，截断规则与 run_simulation 的顺序执行相同
+    """
+    beneficial_cases = []
+    counts = {"evaluated_cases": 0, "total_scenarios": 0, "beneficial_scenarios": 0}
+    for case_index, n_scenarios, n_beneficial, case_data in sorted(
+            (result for shard in shard_results for result in shard), key=lambda r: r[0]):
+        if len(beneficial_cases) >= max_cases:
+            break
+        counts["evaluated_cases"] += 1
+        counts["total_scenarios"] += n_scenarios
+        counts["beneficial_scenarios"] += n_beneficial
+        if case_data is not None:
+            beneficial_cases.append(case_data)
+    return beneficial_cases, counts
+
+
+def run_simulation_parallel(seed: int = None, workers: int = None, n_shards: int = 64,
+                            sample_size: int = 50, max_cases: int = 3, output_path: str = None,
+                            cache_size: int = 0, n_students: int = 4, n_schools: int = 4,
+                            capacities: List[int] = None, max_perms: int = 6, search: str = "sample",
+                            n_false_reports: int = 3, max_updates_per_student: int = 1):
+    """
+    多进程运行模拟，返回值和输出文件与 run_simulation 相同
+
+    n_shards 决定分片方式，不随 workers 改变，保证不同进程数下结果一致。
+    cache_size 大于0时每个工作进程各自维护一个该大小的DA结果缓存。
+    """
+    if search == "best_response":
+        check_report_space(n_schools)
+    sim, all_prefs, sampled_combinations, simulation_data = prepare_simulation(
+        seed, sample_size, 0, n_students, n_schools, capacities, max_perms)
+    seed = simulation_data["metadata"]["seed"]
+    simulation_data["metadata"]["search"] = search
+    if search == "sample":
+        simulation_data["metadata"]["n_false_reports"] = n_false_reports
+        simulation_data["metadata"]["max_updates_per_student"] = max_updates_per_student
+    market = (n_students, n_schools, tuple(sim.capacities))
+
+    shard_size = max(1, -(-len(sampled_combinations) // n_shards))
+    tasks = [(seed, start, sampled_combinations[start:start + shard_size], all_prefs, max_cases,
+              cache_size, market, search, n_false_reports, max_updates_per_student)
+             for start in range(0, len(sampled_combinations), shard_size)]
+
+    # prepare_simulation 已在创建进程池之前填满更新表（学校数较少时），fork 出的工作进程直接共用
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        shard_results = list(pool.map(_run_shard, tasks))
+
+    beneficial_cases, counts = merge_shard_results(shard_results, max_cases)
+    simulation_data["metadata"]["max_cases"] = max_cases
+    simulation_data["metadata"].update(counts)
+
+    # 保存数据到JSON文件
+    simulation_data["cases"] = beneficial_cases
+    filename = save_simulation_data(simulation_data, output_path)
+
+    return simulation_data, filename
+
+
+if __name__ == "__main__":
+    results, filename = run_simulation_parallel()
+    analyze_results(results, filename)
+    save_first_beneficial_case(results)
+    save_all_beneficial_cases(results)
@@ -0,0 +1,265 @@
+"""偏好空间的编号工具
+
+把一个偏好排列编码为 0..n!-1 的整数（按字典序，与 itertools.permutations 的生成顺序一致），
+以及从编号还原排列，并在不枚举全部 n! 个排列的情况下采样排列。
+
+偏好组合空间（多个列表的笛卡尔积）同样按混合进制编号，采样时只生成被抽中的组合，
+内存和时间都与样本量成正比，而不是与空间大小成正比。
+"""
+import random
+import sys
+from math import factorial, prod
+from typing import List, Sequence, Tuple
+
+
+def rank_permutation(perm: Sequence, items: Sequence) -> int:
+    """返回 perm 在 permutations(items) 字典序中的编号"""
+    remaining = list(items)
+    if len(perm) != len(remaining):
+        raise ValueError(f"{list(perm)} 不是 {remaining} 的完整排列")
+    index = 0
+    for item in perm:
+        k = remaining.index(item)
+        index += k * factorial(len(remaining) - 1)
+        del remaining[k]
+    return index
+
+
+def unrank_permutation(index: int, items: Sequence) -> List:
+    """返回 permutations(items) 字典序中编号为 index 的排列"""
+    remaining = list(items)
+    if not 0 <= index < factorial(len(remaining)):
+        raise ValueError(f"排列编号 {index} 超出范围")
+    perm = []
+    for position in range(len(remaining) - 1, -1, -1):
+        k, index = divmod(index, factorial(position))
+        perm.append(remaining.pop(k))
+    return perm
+
+
+def _sample_indices(total: int, k: int, rng: random.Random) -> List[int]:
+    """从 range(total) 中不重复地采样 min(k, total) 个编号
+
+    total 不超过 sys.maxsize 时与 rng.sample(range(total), k) 相同，
+    与对长度为 total 的列表调用 rng.sample 选中的位置也相同。
+    """
+    k = min(k, total)
+    if total <= sys.maxsize:
+        return rng.sample(range(total), k)
+    indices = []
+    seen = set()
+    while len(indices) < k:
+        index = rng.randrange(total)
+        if index not in seen:
+            seen.add(index)
+            indices.append(index)
+    return indices
+
+
+def _sample_positions(candidates: Sequence, k: int, rng: random.Random) -> List:
+    """
+    与 rng.sample(candidates, min(k, len(candidates))) 相同，包括随机数的使用
+
+    候选数不超过21且 k 不超过5时，rng.sample 依次用 randrange(n - i) 从候选池中抽取并把池尾元素换到抽中的位置；
+    这里直接执行这一过程，省去 sample 的固定开销（对每个学生调用一次时，它占了大部分时间）。
+    其他情况直接调用 rng.sample。
+    """
+    n = len(candidates)
+    if k == 1:
+        return [candidates[rng.randrange(n)]]
+    k = min(k, n)
+    if k > 5 or n > 21:
+        return rng.sample(candidates, k)
+    randrange = rng.randrange
+    pool = list(candidates)
+    sampled = []
+    for i in range(k):
+        j = randrange(n - i)
+        sampled.append(pool[j])
+        pool[j] = pool[n - i - 1]
+    return sampled
+
+
+def decode_product_index(index: int, spaces: Sequence[Sequence]) -> Tuple:
+    """返回 itertools.product(*spaces) 中第 index 个组合（最后一个列表变化最快）"""
+    combination = []
+    for space in reversed(spaces):
+        index, digit = divmod(index, len(space))
+        combination.append(space[digit])
+    return tuple(reversed(combination))
+
+
+def sample_product(spaces: Sequence[Sequence], k: int, rng: random.Random) -> List[Tuple]:
+    """不重复地采样 product(*spaces) 中的 min(k, 总数) 个组合，不生成乘积
+
+    结果与 rng.sample(list(product(*spaces)), k) 完全相同。
+    """
+    total = prod(len(space) for space in spaces)
+    return [decode_product_index(index, spaces) for index in _sample_indices(total, k, rng)]
+
+
+def sample_permutations(items: Sequence, k: int, rng: random.Random) -> List[Tuple]:
+    """不重复地采样 min(k, n!) 个排列，不会生成全部排列
+
+    n! 不超过 sys.maxsize 时对排列编号采样后还原，结果与
+    rng.sample(list(permutations(items)), k) 完全相同；更大的空间用随机打乱生成，
+    重复的概率可以忽略，但仍会去重。
+    """
+    items = list(items)
+    total = factorial(len(items))
+    if total <= sys.maxsize:
+        return [tuple(unrank_permutation(index, items))
+                for index in _sample_indices(total, k, rng)]
+    sampled = []
+    seen = set()
+    while len(sampled) < k:
+        perm = tuple(rng.sample(items, len(items)))
+        if perm not in seen:
+            seen.add(perm)
+            sampled.append(perm)
+    return sampled
+
+
+class UpdateTable:
+    """
+    第二轮偏好更新的编号表：(原偏好的排列编号, 第一轮匹配的学校) -> 更新后偏好的排列编号
+
+    第 j 个更新把匹配的学校移到位置 j（j 从0到学校原来的位置），顺序与
+    MatchingSimulation.generate_updated_preferences 生成的候选列表相同。
+    表按需填充，每个排列只还原一次，排列本身以元组保存，查表和采样都不再复制或修改列表。
+    同一组学校共用一张表（见 get_update_table），可以在 fork 工作进程前用 precompute 填满。
+    """
+
+    def __init__(self, items: Sequence):
+        self.items = tuple(items)
+        self._perms = {}           # 排列编号 -> 排列元组
+        self._indices = {}         # 排列元组 -> 排列编号
+        self._updates = {}         # (排列编号, 学校) -> 更新后的排列编号
+        # precompute 填满后按编号索引的列表：排列编号 -> 排列元组，排列编号 -> {学校: 更新后的排列编号}
+        self._perm_list = None
+        self._rows = None
+
+    def __len__(self) -> int:
+        return len(self._updates)
+
+    @property
+    def complete(self) -> bool:
+        """precompute 是否已填满整张表"""
+        return self._rows is not None
+
+    def index(self, perm: Sequence) -> int:
+        perm = tuple(perm)
+        index = self._indices.get(perm)
+        if index is None:
+            index = rank_permutation(perm, self.items)
+            self._indices[perm] = index
+            self._perms[index] = perm
+        return index
+
+    def perm(self, index: int) -> Tuple:
+        perm = self._perms.get(index)
+        if perm is None:
+            perm = tuple(unrank_permutation(index, self.items))
+            self._perms[index] = perm
+            self._indices[perm] = index
+        return perm
+
+    def updates(self, index: int, item) -> Tuple[int, ...]:
+        """把 item 移到它原来位置及之前每个位置得到的排列编号，item 为空（第一轮未匹配）时只有原排列"""
+        if item is None:
+            return (index,)
+        key = (index, item)
+        updates = self._updates.get(key)
+        if updates is None:
+            perm = self.perm(index)
+            position = perm.index(item)
+            rest = perm[:position] + perm[position + 1:]
+            updates = tuple(self.index(rest[:new_position] + (item,) + rest[new_position:])
+                            for new_position in range(position + 1))
+            self._updates[key] = updates
+        return updates
+
+    def sample_updates(self, index: int, item, k: int, rng: random.Random) -> List[int]:
+        """
+        不重复地采样 min(k, 候选数) 个更新，返回排列编号
+
+        随机数的使用与对完整候选列表调用 rng.sample 相同，选中的更新也相同。
+        """
+        updates = self._rows[index][item] if self._rows is not None else self.updates(index, item)
+        return _sample_positions(updates, k, rng)
+
+    def sample_update_lists(self, indices: Sequence[int], items: Sequence, k: int, 
+                            rng: random.Random) -> List[List[List]]:
+        """
+        依次为每个 (排列编号, 学校) 采样更新，返回排列列表；只能在 precompute 填满表之后调用
+
+        选中的更新和随机数的使用都与逐个调用 sample_updates 相同。
+        """
+        rows, perms = self._rows, self._perm_list
+        sampled = []
+        if k == 1:
+            randrange = rng.randrange
+            for index, item in zip(indices, items):
+                updates = rows[index][item]
+                sampled.append([list(perms[updates[randrange(len(updates))]])])
+            return sampled
+        for index, item in zip(indices, items):
+            updates = rows[index][item]
+            sampled.append([list(perms[update]) for update in _sample_positions(updates, k, rng)])
+        return sampled
+
+    def sample_perms(self, pref: Sequence, item, k: int, rng: random.Random) -> List[List]:
+        """
+        不查表，直接从偏好列表采样更新，返回排列列表，选中的更新与 sample_updates 相同
+
+        先对候选的位置采样（rng.sample 选中的位置只取决于候选数），再只构造被选中的更新，
+        每个学生的开销为 O(k * 学校数)，不计算排列编号，适用于无法填满表的大市场。
+        """
+        if item is None:
+            return [list(pref) for _ in _sample_positions(range(1), k, rng)]
+        position = pref.index(item)
+        sampled = []
+        for new_position in _sample_positions(range(position + 1), k, rng):
+            updated = list(pref)
+            del updated[position]
+            updated.insert(new_position, item)
+            sampled.append(updated)
+        return sampled
+
+    def update_perms(self, pref: Sequence, item) -> List[List]:
+        """全部候选更新（排列列表），顺序与 updates 相同"""
+        if item is None:
+            return [list(pref)]
+        position = pref.index(item)
+        rest = list(pref)
+        del rest[position]
+        return [rest[:new_position] + [item] + rest[new_position:]
+                for new_position in range(position + 1)]
+
+    def precompute(self, max_perms: int = 5040) -> bool:
+        """排列数不超过 max_perms 时填满整张表（n! * n 项），之后可以按编号查表，返回是否填满"""
+        if self._rows is not None:
+            return True
+        total = factorial(len(self.items))
+        if total > max_perms:
+            return False
+        rows = []
+        for index in range(total):
+            row = {item: self.updates(index, item) for item in self.items}
+            row[None] = (index,)
+            rows.append(row)
+        self._perm_list = [self.perm(index) for index in range(total)]
+        self._rows = rows
+        return True
+
+
+_UPDATE_TABLES = {}
+
+
+def get_update_table(items: Sequence) -> UpdateTable:
+    """返回这组学校共用的更新表，同一进程内只构造一次"""
+    key = tuple(items)
+    table = _UPDATE_TABLES.get(key)
+    if table is None:
+        table = _UPDATE_TABLES[key] = UpdateTable(key)
+    return table
@@ -0,0 +1,99 @@
+"""run_simulation 的分阶段计时和计数
+
+各阶段的墙钟时间和调用次数：
+- prepare:        生成偏好空间并采样偏好组合
+- evaluate:       计算案例（包括下面的 da 和 updates）
+- da:             MatchingSimulation.da_algorithm（包括缓存查找）
+- updates:        MatchingSimulation.generate_updated_preferences
+- case_building:  evaluate 中除 da 和 updates 以外的部分，主要是构造 case_data 字典
+- serialization:  把有利案例写入流式结果文件，或最后保存JSON结果文件
+
+best_response 搜索直接调用整数引擎，它的DA时间计入 case_building 而不是 da。
+
+DA的申请次数由匹配结果推算：每个学生从列表开头依次申请到匹配学校为止（未匹配则申请完整个列表）。
+整数引擎没有“轮”的概念，max_student_proposals 为单个学生的最多申请次数，
+即逐轮执行的DA轮数的下界。
+"""
+import time
+from typing import Dict, List
+
+
+class SimulationProfiler:
+    """累计各阶段的时间和次数，每隔 progress_interval 秒打印一行进度（为空时不打印）"""
+
+    def __init__(self, progress_interval: float = 10.0):
+        self.progress_interval = progress_interval
+        self.stages = {}  # 阶段名 -> [秒数, 次数]
+        self.da_proposals = 0
+        self.max_student_proposals = 0
+        self.cases = 0
+        self.total_cases = None
+        self._start = time.perf_counter()
+        self._last_progress = self._start
+
+    def add(self, stage: str, seconds: float, calls: int = 1):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def record_da(self, seconds: float, student_prefs: Dict[str, List[str]], matching: Dict[str, str]):
+        """记录一次DA求解的时间和申请次数"""
+        self.add("da", seconds)
+        for student, pref in student_prefs.items():
+            school = matching.get(student)
+            proposals = pref.index(school) + 1 if school is not None else len(pref)
+            self.da_proposals += proposals
+            if proposals > self.max_student_proposals:
+                self.max_student_proposals = proposals
+
+    def case_done(self, total_cases: int = None):
+        """记录完成一个案例，距离上次进度输出超过 progress_interval 秒时打印进度"""
+        self.cases += 1
+        self.total_cases = total_cases
+        now = time.perf_counter()
+        if self.progress_interval is not None and now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            print(self.progress_line())
+
+    def _seconds(self, stage: str) -> float:
+        return self.stages.get(stage, (0.0, 0))[0]
+
+    def progress_line(self) -> str:
+        elapsed = time.perf_counter() - self._start
+        total = f"/{self.total_cases}" if self.total_cases is not None else ""
+        rate = self.cases / elapsed if elapsed else 0.0
+        shares = "，".join(f"{stage} {self._seconds(stage) / elapsed:.0%}"
+                          for stage in ("da", "updates", "serialization") if stage in self.stages)
+        return f"[进度] 已计算 {self.cases}{total} 个案例，{rate:.1f} 案例/秒，用时 {elapsed:.1f} 秒（{shares}）"
+
+    def summary_line(self, filename: str, seconds: float) -> str:
+        """保存结果文件后的汇总行，包括保存的用时"""
+        elapsed = time.perf_counter() - self._start
+        share = seconds / elapsed if elapsed else 0.0
+        return (f"[完成] {self.cases} 个案例，总用时 {elapsed:.1f} 秒，"
+                f"保存 {filename} 用时 {seconds:.2f} 秒（{share:.0%}）")
+
+    def report(self) -> dict:
+        """返回可以写入 metadata 的统计结果"""
+        elapsed = time.perf_counter() - self._start
+        stages = {name: [seconds, calls] for name, (seconds, calls) in self.stages.items()}
+        if "evaluate" in stages:
+            stages["case_building"] = [
+                max(0.0, self._seconds("evaluate") - self._seconds("da") - self._seconds("updates")),
+                stages["evaluate"][1]]
+        da_solves = self.stages.get("da", (0.0, 0))[1]
+        return {
+            "wall_seconds": elapsed,
+            "cases": self.cases,
+            "cases_per_second": self.cases / elapsed if elapsed else 0.0,
+            "stages": {name: {"seconds": seconds, "calls": calls,
+                              "share": seconds / elapsed if elapsed else 0.0}
+                       for name, (seconds, calls) in stages.items()},
+            "da_solves": da_solves,
+            "da_proposals": self.da_proposals,
+            "proposals_per_solve": self.da_proposals / da_solves if da_solves else 0.0,
+            "max_student_proposals": self.max_student_proposals,
+        }
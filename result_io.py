@@ -0,0 +1,104 @@
+"""流式结果读写
+
+JSONL 格式每行一个紧凑的JSON对象：
+- {"metadata": {...}} 元数据记录，文件开头写入一次，结束时再写入一次最终的统计信息
+- {"case": {...}}     案例记录，在产生时立即追加写入
+
+文件名以 .gz 结尾时使用 gzip 压缩。读取时案例按需逐行解析，不会一次性载入内存。
+文件名以 .sqbm 结尾时使用 result_store 中的二进制格式，接口相同。
+"""
+import gzip
+import json
+from typing import Iterator, List
+
+from result_store import BinaryResultStore, BinaryResultWriter, is_binary_path
+
+
+def is_stream_path(path: str) -> bool:
+    """判断输出文件名是否使用流式格式（JSONL或二进制）"""
+    return path is not None and (path.endswith(('.jsonl', '.jsonl.gz')) or is_binary_path(path))
+
+
+def _open_text(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+class JsonlResultWriter:
+    """逐条追加写入案例记录的JSONL写入器"""
+
+    def __init__(self, path: str, metadata: dict):
+        self.path = path
+        self.case_count = 0
+        self._file = _open_text(path, 'w')
+        self._file.write(_dumps({"metadata": metadata}) + '\n')
+
+    def write_case(self, case_data: dict):
+        self._file.write(_dumps({"case": case_data}) + '\n')
+        self._file.flush()
+        self.case_count += 1
+
+    def close(self, metadata: dict = None):
+        """关闭文件，metadata 非空时先追加最终的元数据记录"""
+        if self._file is None:
+            return
+        if metadata is not None:
+            self._file.write(_dumps({"metadata": metadata}) + '\n')
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class StreamedCases:
+    """JSONL文件中案例记录的惰性视图，每次迭代重新读取文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[dict]:
+        with _open_text(self.path, 'r') as f:
+            for line in f:
+                if line.startswith('{"case"'):
+                    yield json.loads(line)["case"]
+
+
+def load_metadata(path: str) -> dict:
+    """读取JSONL文件的元数据，后写入的记录覆盖先写入的，案例记录不会被解析"""
+    metadata = {}
+    with _open_text(path, 'r') as f:
+        for line in f:
+            if line.startswith('{"metadata"'):
+                metadata.update(json.loads(line)["metadata"])
+    return metadata
+
+
+def open_result_writer(path: str, metadata: dict, students: List[str], schools: List[str]):
+    """根据文件名创建JSONL或二进制格式的写入器"""
+    if is_binary_path(path):
+        return BinaryResultWriter(path, metadata, students, schools)
+    return JsonlResultWriter(path, metadata)
+
+
+def open_cases(path: str):
+    """返回流式结果文件中案例的惰性视图"""
+    if is_binary_path(path):
+        return BinaryResultStore(path)
+    return StreamedCases(path)
+
+
+def load_simulation_stream(path: str) -> dict:
+    """以 simulation_data 的结构打开流式结果文件，cases 为惰性迭代的案例视图"""
+    cases = open_cases(path)
+    if isinstance(cases, BinaryResultStore):
+        return {"metadata": cases.metadata, "cases": cases}
+    return {"metadata": load_metadata(path), "cases": cases}
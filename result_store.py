@@ -0,0 +1,276 @@
+"""紧凑的二进制结果格式（.sqbm）
+
+每个第二轮策略组合保存为一条定长记录，偏好排列保存为排列编号（见 preference_space），
+匹配结果保存为每个学生的学校编号（未匹配为-1）。文件结构：
+
+- 0..63:       文件头（魔数、版本、学生数、学校数、排列编号宽度、记录长度、元数据长度）
+- 64..4095:    元数据JSON（包括学生和学校名称），关闭时写入最终的统计信息
+- 4096 开始:   连续的定长记录，记录数由文件大小推算，异常中断时末尾不完整的记录被忽略
+
+读取时通过 mmap 直接按字段解析，统计分析不需要构造字典；
+安装 numpy 时可以用 as_array() 得到结构化的内存映射数组。
+"""
+import json
+import mmap
+import os
+import struct
+from math import factorial
+from typing import Dict, Iterator, List, Tuple
+
+from preference_space import rank_permutation, unrank_permutation
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，只有 as_array 需要
+    np = None
+
+MAGIC = b'SQBM'
+# 版本2把 strategy_index 从 uint16 改为 uint32（best_response 搜索一个案例可能有几十万种虚假申报），
+# 版本1的文件仍然可以读取
+VERSION = 2
+_STRATEGY_FORMATS = {1: 'H', 2: 'I'}
+HEADER = struct.Struct('<4sHHHcxII')
+METADATA_OFFSET = 64
+DATA_OFFSET = 4096
+# struct 格式到 numpy 类型的对应关系
+_NUMPY_TYPES = {'I': '<u4', 'Q': '<u8', 'H': '<u2', 'B': 'u1', 'h': '<i2'}
+
+
+def is_binary_path(path: str) -> bool:
+    """判断输出文件名是否使用二进制格式"""
+    return path is not None and path.endswith('.sqbm')
+
+
+def _record_fields(n_students: int, n_schools: int, index_format: str, 
+                   version: int = VERSION) -> List[Tuple[str, str, int]]:
+    """记录中的字段：(字段名, struct格式, 元素个数)"""
+    return [
+        ("case_id", 'I', 1),
+        ("strategy_index", _STRATEGY_FORMATS[version], 1),
+        ("is_beneficial", 'B', 1),
+        ("school_prefs", index_format, n_schools),
+        ("student_prefs", index_format, n_students),
+        ("false_pref", index_format, 1),
+        ("honest_matching", 'h', n_students),
+        ("first_matching", 'h', n_students),
+        ("updated_prefs", index_format, n_students),
+        ("second_matching", 'h', n_students),
+    ]
+
+
+class _Layout:
+    """记录的二进制布局"""
+
+    def __init__(self, n_students: int, n_schools: int, index_format: str, version: int = VERSION):
+        self.fields = _record_fields(n_students, n_schools, index_format, version)
+        self.record = struct.Struct('<' + ''.join(f"{count}{fmt}" for _, fmt, count in self.fields))
+        # 每个字段在记录中的偏移量和单独解析用的 Struct
+        self.offsets = {}
+        offset = 0
+        for name, fmt, count in self.fields:
+            field = struct.Struct(f"<{count}{fmt}")
+            self.offsets[name] = (offset, field, count)
+            offset += field.size
+
+
+class BinaryResultWriter:
+    """按策略组合逐条写入定长记录的二进制写入器，接口与 JsonlResultWriter 相同"""
+
+    def __init__(self, path: str, metadata: dict, students: List[str], schools: List[str]):
+        self.path = path
+        self.students = list(students)
+        self.schools = list(schools)
+        self.case_count = 0
+        n_students, n_schools = len(self.students), len(self.schools)
+        if max(n_students, n_schools) > 20:
+            raise ValueError("二进制格式的排列编号最多支持20个学生或学校")
+        index_format = 'I' if factorial(max(n_students, n_schools)) <= 2 ** 32 else 'Q'
+        self._layout = _Layout(n_students, n_schools, index_format)
+        self._school_index = {school: i for i, school in enumerate(self.schools)}
+        self._header = HEADER.pack(MAGIC, VERSION, n_students, n_schools, index_format.encode(),
+                                   self._layout.record.size, 0)
+        self._file = open(path, 'wb')
+        self._write_metadata(metadata)
+        self._file.seek(DATA_OFFSET)
+
+    def _write_metadata(self, metadata: dict):
+        payload = json.dumps(dict(metadata, students=self.students, schools=self.schools),
+                             ensure_ascii=False).encode('utf-8')
+        if len(payload) > DATA_OFFSET - METADATA_OFFSET:
+            raise ValueError("元数据过大，无法写入二进制文件头")
+        header = self._header[:-4] + struct.pack('<I', len(payload))
+        self._file.seek(0)
+        self._file.write(header.ljust(METADATA_OFFSET, b'\0'))
+        self._file.write(payload.ljust(DATA_OFFSET - METADATA_OFFSET, b'\0'))
+
+    def _encode_matching(self, matching: Dict[str, str]) -> List[int]:
+        return [self._school_index[matching[student]] if student in matching else -1
+                for student in self.students]
+
+    def write_case(self, case_data: dict):
+        students, schools = self.students, self.schools
+        initial = case_data["initial_setup"]
+        school_prefs = [rank_permutation(initial["school_preferences"][school], students)
+                        for school in schools]
+        student_prefs = [rank_permutation(initial["student_preferences"][student], schools)
+                         for student in students]
+        honest_matching = self._encode_matching(case_data["honest_scenario"]["first_round"]["matching"])
+
+        pack = self._layout.record.pack
+        for strategy_index, strategy in enumerate(case_data["strategic_scenarios"]):
+            false_pref = rank_permutation(strategy["false_preference"], schools)
+            first_matching = self._encode_matching(strategy["first_round"]["matching"])
+            for second_round in strategy["second_round_scenarios"]:
+                updated = second_round["updated_preferences"]
+                self._file.write(pack(
+                    case_data["case_id"], strategy_index, second_round["outcome"]["is_beneficial"],
+                    *school_prefs, *student_prefs, false_pref, *honest_matching, *first_matching,
+                    *(rank_permutation(updated[student], schools) for student in students),
+                    *self._encode_matching(second_round["matching"])))
+        self._file.flush()
+        self.case_count += 1
+
+    def close(self, metadata: dict = None):
+        """关闭文件，metadata 非空时先把最终的元数据写回文件头"""
+        if self._file is None:
+            return
+        if metadata is not None:
+            self._write_metadata(metadata)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class BinaryResultStore:
+    """通过 mmap 读取二进制结果文件
+
+    迭代时按案例还原为与 run_simulation 相同结构的字典；
+    summary() 和 column() 直接解析所需字段，不构造字典。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(METADATA_OFFSET)
+            magic, version, n_students, n_schools, index_format, record_size, metadata_len = \
+                HEADER.unpack_from(header)
+            if magic != MAGIC or version not in _STRATEGY_FORMATS:
+                raise ValueError(f"{path} 不是受支持的二进制结果文件")
+            f.seek(METADATA_OFFSET)
+            self.metadata = json.loads(f.read(metadata_len).decode('utf-8'))
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.n_students = n_students
+        self.n_schools = n_schools
+        self.students = self.metadata["students"]
+        self.schools = self.metadata["schools"]
+        self._layout = _Layout(n_students, n_schools, index_format.decode(), version)
+        if self._layout.record.size != record_size:
+            raise ValueError(f"{path} 的记录长度与文件头不一致")
+        self.record_count = max(0, size - DATA_OFFSET) // record_size
+
+    def column(self, name: str) -> Iterator:
+        """逐条返回某个字段的值，单元素字段返回标量，其余返回元组"""
+        offset, field, count = self._layout.offsets[name]
+        record_size = self._layout.record.size
+        for i in range(self.record_count):
+            values = field.unpack_from(self._mmap, DATA_OFFSET + i * record_size + offset)
+            yield values[0] if count == 1 else values
+
+    def summary(self) -> Dict[str, int]:
+        """统计案例数、策略组合数和有利策略组合数"""
+        total_cases = 0
+        beneficial = 0
+        last_case = None
+        for case_id, is_beneficial in zip(self.column("case_id"), self.column("is_beneficial")):
+            if case_id != last_case:
+                total_cases += 1
+                last_case = case_id
+            beneficial += is_beneficial
+        return {"total_cases": total_cases, "total_scenarios": self.record_count,
+                "beneficial_scenarios": beneficial}
+
+    def as_array(self):
+        """以 numpy 结构化数组的形式内存映射全部记录（需要numpy）"""
+        if np is None:
+            raise ImportError("as_array 需要安装 numpy")
+        dtype = np.dtype([(name, _NUMPY_TYPES[fmt], (count,) if count > 1 else ())
+                          for name, fmt, count in self._layout.fields])
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=DATA_OFFSET, shape=(self.record_count,))
+
+    def _decode_prefs(self, indices, names: List[str], items: List[str]) -> Dict[str, List[str]]:
+        return {name: unrank_permutation(index, items) for name, index in zip(names, indices)}
+
+    def _decode_matching(self, matching) -> Dict[str, str]:
+        matched = sorted((school, student) for student, school in enumerate(matching) if school != -1)
+        return {self.students[student]: self.schools[school] for school, student in matched}
+
+    def __iter__(self) -> Iterator[dict]:
+        students, schools = self.students, self.schools
+        s1 = students[0]
+        unpack = self._layout.record.unpack_from
+        record_size = self._layout.record.size
+        n, m = self.n_students, self.n_schools
+        case_data = None
+        for i in range(self.record_count):
+            values = unpack(self._mmap, DATA_OFFSET + i * record_size)
+            case_id, strategy_index, is_beneficial = values[:3]
+            pos = 3
+            school_prefs, pos = values[pos:pos + m], pos + m
+            student_prefs, pos = values[pos:pos + n], pos + n
+            false_pref, pos = values[pos], pos + 1
+            honest_matching, pos = values[pos:pos + n], pos + n
+            first_matching, pos = values[pos:pos + n], pos + n
+            updated_prefs, pos = values[pos:pos + n], pos + n
+            second_matching = values[pos:pos + n]
+
+            if case_data is None or case_data["case_id"] != case_id:
+                if case_data is not None:
+                    yield case_data
+                honest_prefs = self._decode_prefs(student_prefs, students, schools)
+                decoded_schools = self._decode_prefs(school_prefs, schools, students)
+                honest = self._decode_matching(honest_matching)
+                case_data = {
+                    "case_id": case_id,
+                    "initial_setup": {
+                        "student_preferences": dict(honest_prefs),
+                        "school_preferences": decoded_schools
+                    },
+                    "honest_scenario": {
+                        "first_round": {"preferences": honest_prefs, "matching": honest}
+                    },
+                    "strategic_scenarios": []
+                }
+            strategies = case_data["strategic_scenarios"]
+            if len(strategies) <= strategy_index:
+                false_preference = unrank_permutation(false_pref, schools)
+                first_prefs = dict(case_data["initial_setup"]["student_preferences"])
+                first_prefs[s1] = false_preference
+                strategies.append({
+                    "false_preference": false_preference,
+                    "first_round": {"preferences": first_prefs,
+                                    "matching": self._decode_matching(first_matching)},
+                    "second_round_scenarios": []
+                })
+            second = self._decode_matching(second_matching)
+            strategies[strategy_index]["second_round_scenarios"].append({
+                "updated_preferences": self._decode_prefs(updated_prefs, students, schools),
+                "matching": second,
+                "outcome": {
+                    "honest_result": case_data["honest_scenario"]["first_round"]["matching"].get(s1),
+                    "strategic_result": second.get(s1),
+                    "is_beneficial": bool(is_beneficial)
+                }
+            })
+        if case_data is not None:
+            yield case_data
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
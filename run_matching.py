@@ -1,213 +1,418 @@
 from matching_simulation import MatchingSimulation
 from itertools import product
+from math import prod
 from typing import Dict, List, Tuple
 import json
+import os
+import random
+import time
 from datetime import datetime
 
-def run_simulation():
-    sim = MatchingSimulation()
-    all_prefs = sim.generate_all_preferences()
+from result_io import (JsonlResultWriter, StreamedCases, is_stream_path, open_cases, 
+                       open_result_writer)
+from result_store import BinaryResultStore
+from preference_space import get_update_table, sample_product
+from best_response import best_response_case, check_report_space
+from profiling import SimulationProfiler
+from checkpoint import load_checkpoint, restore_stream_writer, save_checkpoint
+
+def case_rng(seed: int, case_index: int) -> random.Random:
+    """每个案例使用独立的随机数生成器，结果与案例的执行顺序和分片方式无关"""
+    return random.Random(f"{seed}:{case_index}")
+
+def prepare_simulation(seed: int = None, sample_size: int = 50, cache_size: int = 0, 
+                       n_students: int = 4, n_schools: int = 4, capacities: List[int] = None, 
+                       max_perms: int = 6):
+    """
+    生成偏好空间并采样偏好组合，返回 (sim, all_prefs, sampled_combinations, simulation_data)
     
-    # 存储有利的策略性案例
-    beneficial_cases = []
-    max_cases = 3  # 进一步限制案例数量
+    cache_size 大于0时为 sim 启用对应大小的DA结果缓存；
+    max_perms 为学生和学校各自采样的偏好排列数。
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rng = random.Random(seed)
     
-    # 大幅减少采样数量
-    sample_size = 50  # 减少采样数量
+    sim = MatchingSimulation(n_students, n_schools, capacities)
+    sim.enable_cache(cache_size)
+    # 学校不超过7所时填满第二轮更新表（同一组学校在进程内只填一次），之后按排列编号查表采样
+    get_update_table(sim.schools).precompute()
+    all_prefs = sim.generate_all_preferences(rng, max_perms, max_perms)
     
-    # 准备采样的偏好组合
-    preference_combinations = list(product(
-        all_prefs['s2'], all_prefs['s3'], all_prefs['s4'],
-        all_prefs['c1'], all_prefs['c2'], all_prefs['c3'], all_prefs['c4']
-    ))
+    # 偏好组合空间：除s1以外的学生偏好和所有学校偏好的乘积，只按编号采样，不生成整个乘积
+    preference_spaces = ([all_prefs[student] for student in sim.students[1:]] + 
+                         [all_prefs[school] for school in sim.schools])
+    total_combinations = prod(len(space) for space in preference_spaces)
     
     # 随机采样
-    import random
-    sampled_combinations = random.sample(preference_combinations, 
-                                       min(sample_size, len(preference_combinations)))
+    sampled_combinations = sample_product(preference_spaces, sample_size, rng)
     
     simulation_data = {
         "metadata": {
             "timestamp": datetime.now().isoformat(),
+            "seed": seed,
+            "n_students": n_students,
+            "n_schools": n_schools,
+            "capacities": sim.capacities,
             "sample_size": sample_size,
-            "total_combinations": len(preference_combinations)
+            "max_perms": max_perms,
+            "total_combinations": total_combinations
         },
         "cases": []
     }
+    return sim, all_prefs, sampled_combinations, simulation_data
+
+def simulate_case(sim: MatchingSimulation, case_index: int, combination: Tuple, 
+                  all_prefs: Dict[str, List[List[str]]], rng: random.Random, 
+                  n_false_reports: int = 3, max_updates_per_student: int = 1) -> dict:
+    """
+    模拟一个偏好组合：诚实申报、s1的虚假申报及第二轮偏好更新
+
+    从 all_prefs 中为 s1 采样 n_false_reports 种申报（与真实偏好相同的被跳过），
+    每个学生采样最多 max_updates_per_student 种第二轮更新。
+    """
+    s1 = sim.students[0]
+    others = sim.students[1:]
+    
+    def true_rank(school):
+        # s1按真实偏好对学校的排名，未匹配排在所有学校之后
+        return sim.s1_true_pref.index(school) if school is not None else len(sim.s1_true_pref)
+    student_combination = combination[:len(others)]
+    school_combination = combination[len(others):]
+    
+    # 基准情况：s1诚实申报
+    honest_prefs = {s1: sim.s1_true_pref}
+    honest_prefs.update({student: list(pref) for student, pref in zip(others, student_combination)})
+    school_prefs = {school: list(pref) for school, pref in zip(sim.schools, school_combination)}
+    # 其他学生在每种虚假申报下的第一轮偏好都相同，排列编号每个案例只计算一次
+    pref_indices = sim.preference_indices(student_combination)
+    
+    case_data = {
+        "case_id": case_index,
+        "initial_setup": {
+            "student_preferences": dict(honest_prefs),
+            "school_preferences": dict(school_prefs)
+        },
+        "honest_scenario": {},
+        "strategic_scenarios": []
+    }
+    
+    # 运行诚实申报的第一轮
+    honest_first_matching = sim.da_algorithm(honest_prefs, school_prefs)
+    
+    # 记录诚实情况的数据
+    case_data["honest_scenario"] = {
+        "first_round": {
+            "preferences": honest_prefs,
+            "matching": honest_first_matching
+        }
+    }
+    
+    # 对s1的虚假申报采样，进一步减少数量
+    sampled_s1_prefs = rng.sample(list(all_prefs[s1]), 
+                                  min(n_false_reports, len(all_prefs[s1])))
     
-    # 遍历采样的偏好组合
-    for case_index, (s2_pref, s3_pref, s4_pref, c1_pref, c2_pref, c3_pref, c4_pref) in enumerate(sampled_combinations):
-        if len(beneficial_cases) >= max_cases:
-            break
+    for s1_false_pref in sampled_s1_prefs:
+        if list(s1_false_pref) == sim.s1_true_pref:
+            continue
             
-        case_data = {
-            "case_id": case_index,
-            "initial_setup": {
-                "student_preferences": {
-                    's1': sim.s1_true_pref,
-                    's2': list(s2_pref),
-                    's3': list(s3_pref),
-                    's4': list(s4_pref)
-                },
-                "school_preferences": {
-                    'c1': list(c1_pref),
-                    'c2': list(c2_pref),
-                    'c3': list(c3_pref),
-                    'c4': list(c4_pref)
-                }
-            },
-            "honest_scenario": {},
-            "strategic_scenarios": []
+        strategic_scenario = {
+            "false_preference": list(s1_false_pref),
+            "first_round": {},
+            "second_round_scenarios": []
         }
         
-        # 基准情况：s1诚实申报
-        honest_prefs = {
-            's1': sim.s1_true_pref,
-            's2': list(s2_pref),
-            's3': list(s3_pref),
-            's4': list(s4_pref)
-        }
-        school_prefs = {
-            'c1': list(c1_pref),
-            'c2': list(c2_pref),
-            'c3': list(c3_pref),
-            'c4': list(c4_pref)
-        }
+        # 运行虚假申报的第一轮
+        strategic_first_prefs = dict(honest_prefs)
+        strategic_first_prefs[s1] = list(s1_false_pref)
+        strategic_first_matching = sim.da_algorithm(
+            strategic_first_prefs, school_prefs)
         
-        # 运行诚实申报的第一轮
-        honest_first_matching = sim.da_algorithm(honest_prefs, school_prefs)
+        # 如果第一轮匹配结果与诚实情况相同，跳过这种策略
+        if strategic_first_matching == honest_first_matching:
+            continue
         
-        # 记录诚实情况的数据
-        case_data["honest_scenario"] = {
-            "first_round": {
-                "preferences": honest_prefs,
-                "matching": honest_first_matching
-            }
+        # 记录第一轮数据
+        strategic_scenario["first_round"] = {
+            "preferences": strategic_first_prefs,
+            "matching": strategic_first_matching
         }
         
-        # 对s1的虚假申报采样，进一步减少数量
-        sampled_s1_prefs = random.sample(list(all_prefs['s1']), 
-                                       min(3, len(all_prefs['s1'])))  # 只测试3种虚假申报
+        # 为每个学生采样策略性申报情况下的第二轮偏好更新（不生成全部候选）
+        strategic_updated_prefs = sim.sample_updated_preferences(
+            strategic_first_matching, strategic_first_prefs, max_updates_per_student, rng, 
+            pref_indices)
+        sampled_updates = [strategic_updated_prefs[student] for student in others]
         
-        for s1_false_pref in sampled_s1_prefs:
-            if list(s1_false_pref) == sim.s1_true_pref:
-                continue
-                
-            strategic_scenario = {
-                "false_preference": list(s1_false_pref),
-                "first_round": {},
-                "second_round_scenarios": []
-            }
-            
-            # 运行虚假申报的第一轮
-            strategic_first_prefs = {
-                's1': list(s1_false_pref),
-                's2': list(s2_pref),
-                's3': list(s3_pref),
-                's4': list(s4_pref)
-            }
-            strategic_first_matching = sim.da_algorithm(
-                strategic_first_prefs, school_prefs)
-            
-            # 如果第一轮匹配结果与诚实情况相同，跳过这种策略
-            if strategic_first_matching == honest_first_matching:
-                continue
+        # 使用采样后的更新偏好
+        for updated_combination in product(*sampled_updates):
+            # 运行虚假申报的第二轮（使用真实偏好）
+            strategic_second_round_prefs = {s1: sim.s1_true_pref}
+            strategic_second_round_prefs.update(zip(others, updated_combination))
+            strategic_second_matching = sim.da_algorithm(
+                strategic_second_round_prefs, school_prefs)
             
-            # 记录第一轮数据
-            strategic_scenario["first_round"] = {
-                "preferences": strategic_first_prefs,
-                "matching": strategic_first_matching
+            # 记录每种可能的第二轮情况
+            second_round_scenario = {
+                "updated_preferences": strategic_second_round_prefs,
+                "matching": strategic_second_matching
             }
             
-            # 生成策略性申报情况下的第二轮偏好更新
-            strategic_updated_prefs = sim.generate_updated_preferences(
-                strategic_first_matching, strategic_first_prefs)
+            # 检查是否获得更好的结果（与第一轮诚实结果比较）
+            honest_school = honest_first_matching.get(s1)
+            strategic_final_school = strategic_second_matching.get(s1)
             
-            # 进一步限制每个学生的更新偏好采样数
-            max_updates_per_student = 1  # 每个学生只测试1种更新偏好
-            sampled_updates = {
-                's2': random.sample(strategic_updated_prefs['s2'], 
-                                  min(max_updates_per_student, len(strategic_updated_prefs['s2']))),
-                's3': random.sample(strategic_updated_prefs['s3'], 
-                                  min(max_updates_per_student, len(strategic_updated_prefs['s3']))),
-                's4': random.sample(strategic_updated_prefs['s4'], 
-                                  min(max_updates_per_student, len(strategic_updated_prefs['s4'])))
+            second_round_scenario["outcome"] = {
+                "honest_result": honest_school,
+                "strategic_result": strategic_final_school,
+                "is_beneficial": true_rank(strategic_final_school) < true_rank(honest_school)
             }
             
-            # 使用采样后的更新偏好
-            for s2_updated_pref in sampled_updates['s2']:
-                for s3_updated_pref in sampled_updates['s3']:
-                    for s4_updated_pref in sampled_updates['s4']:
-                        # 运行虚假申报的第二轮（使用真实偏好）
-                        strategic_second_round_prefs = {
-                            's1': sim.s1_true_pref,
-                            's2': s2_updated_pref,
-                            's3': s3_updated_pref,
-                            's4': s4_updated_pref
-                        }
-                        strategic_second_matching = sim.da_algorithm(
-                            strategic_second_round_prefs, school_prefs)
-                        
-                        # 记录每种可能的第二轮情况
-                        second_round_scenario = {
-                            "updated_preferences": strategic_second_round_prefs,
-                            "matching": strategic_second_matching
-                        }
-                        
-                        # 检查是否获得更好的结果（与第一轮诚实结果比较）
-                        honest_school = honest_first_matching['s1']
-                        strategic_final_school = strategic_second_matching['s1']
-                        
-                        second_round_scenario["outcome"] = {
-                            "honest_result": honest_school,
-                            "strategic_result": strategic_final_school,
-                            "is_beneficial": (sim.s1_true_pref.index(strategic_final_school) < 
-                                            sim.s1_true_pref.index(honest_school))
-                        }
-                        
-                        strategic_scenario["second_round_scenarios"].append(second_round_scenario)
-            
-            case_data["strategic_scenarios"].append(strategic_scenario)
+            strategic_scenario["second_round_scenarios"].append(second_round_scenario)
         
-        has_beneficial_strategy = False
-        for strategy in case_data["strategic_scenarios"]:
-            for second_round in strategy["second_round_scenarios"]:
-                if second_round["outcome"]["is_beneficial"]:
-                    has_beneficial_strategy = True
-                    break
-            if has_beneficial_strategy:
+        case_data["strategic_scenarios"].append(strategic_scenario)
+    
+    return case_data
+
+def evaluate_case(sim: MatchingSimulation, case_index: int, combination: Tuple, 
+                  all_prefs: Dict[str, List[List[str]]], seed: int, search: str = "sample", 
+                  n_false_reports: int = 3, max_updates_per_student: int = 1) -> dict:
+    """
+    按搜索方式计算一个案例：sample 为随机采样策略，best_response 为精确的最优反应搜索
+
+    n_false_reports 和 max_updates_per_student 只用于 sample；best_response 检查 s1 的全部排列，
+    不受 all_prefs 中采样的 max_perms 种排列限制，只支持不超过8所学校的小市场。
+    """
+    if search == "best_response":
+        return best_response_case(sim, case_index, combination)
+    if search != "sample":
+        raise ValueError(f"未知的搜索方式: {search}")
+    return simulate_case(sim, case_index, combination, all_prefs, case_rng(seed, case_index), 
+                         n_false_reports, max_updates_per_student)
+
+def count_scenarios(case_data: dict) -> Tuple[int, int]:
+    """统计一个案例中的策略组合数和有利策略组合数"""
+    total_scenarios = 0
+    beneficial_scenarios = 0
+    for strategy in case_data["strategic_scenarios"]:
+        for second_round in strategy["second_round_scenarios"]:
+            total_scenarios += 1
+            if second_round["outcome"]["is_beneficial"]:
+                beneficial_scenarios += 1
+    return total_scenarios, beneficial_scenarios
+
+def save_simulation_data(simulation_data: dict, filename: str = None) -> str:
+    """保存模拟数据到JSON文件（文件名以 .jsonl/.jsonl.gz/.sqbm 结尾时保存为流式格式），返回文件名"""
+    if filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"beneficial_simulation_results_{timestamp}.json"
+    if is_stream_path(filename):
+        metadata = simulation_data["metadata"]
+        sim = MatchingSimulation(metadata.get("n_students", 4), metadata.get("n_schools", 4))
+        writer = open_result_writer(filename, metadata, sim.students, sim.schools)
+        for case_data in simulation_data["cases"]:
+            writer.write_case(case_data)
+        writer.close()
+        return filename
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(simulation_data, f, indent=2, ensure_ascii=False)
+    return filename
+
+def run_simulation(seed: int = None, sample_size: int = 50, max_cases: int = 3, 
+                   output_path: str = None, cache_size: int = 0, 
+                   n_students: int = 4, n_schools: int = 4, capacities: List[int] = None, 
+                   max_perms: int = 6, search: str = "sample", n_false_reports: int = 3, 
+                   max_updates_per_student: int = 1, profile: bool = False, 
+                   progress_interval: float = 10.0, checkpoint_path: str = None, 
+                   checkpoint_interval: float = 60.0, resume: bool = False):
+    """
+    运行模拟，seed 相同时结果完全相同（metadata 中的时间戳除外）
+    
+    search 为 "best_response" 时对每个偏好组合检查 s1 的全部虚假申报和全部第二轮更新组合，
+    而不是随机采样 n_false_reports 种虚假申报和每个学生 max_updates_per_student 种更新；
+    这种搜索只适用于小市场，多于8所学校时在开始前抛出 ValueError。
+    
+    output_path 以 .jsonl、.jsonl.gz 或 .sqbm（二进制格式）结尾时，有利案例在产生时逐条追加到文件中，
+    不在内存中累积，返回的 simulation_data["cases"] 为惰性读取该文件的案例视图。
+    
+    profile 为 True 时记录各阶段的耗时和次数（见 profiling），每隔 progress_interval 秒打印一行进度，
+    结果写入 metadata["profile"]。保存JSON文件的时间在写入文件之后才知道：文件中的 profile 不包括它，
+    返回的 metadata["profile"] 的 serialization 阶段包括它，并打印一行汇总。
+    
+    checkpoint_path 非空时每隔 checkpoint_interval 秒（以及结束时）把进度写入检查点（见 checkpoint）；
+    resume 为 True 且检查点存在时从检查点继续，参数必须与检查点中的相同（可以用 resume_simulation）。
+    """
+    if search == "best_response":
+        check_report_space(n_schools)
+    params = {"seed": seed, "sample_size": sample_size, "max_cases": max_cases, 
+              "output_path": output_path, "cache_size": cache_size, "n_students": n_students, 
+              "n_schools": n_schools, "capacities": capacities, "max_perms": max_perms, 
+              "search": search, "n_false_reports": n_false_reports, 
+              "max_updates_per_student": max_updates_per_student}
+    state = None
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        state = load_checkpoint(checkpoint_path)
+        if seed is None:
+            seed = params["seed"] = state["params"]["seed"]
+        if state["params"] != params:
+            raise ValueError(f"运行参数与检查点 {checkpoint_path} 不一致: {state['params']}")
+    
+    profiler = SimulationProfiler(progress_interval) if profile else None
+    started = time.perf_counter()
+    sim, all_prefs, sampled_combinations, simulation_data = prepare_simulation(
+        seed, sample_size, cache_size, n_students, n_schools, capacities, max_perms)
+    seed = simulation_data["metadata"]["seed"]
+    if profiler is not None:
+        profiler.add("prepare", time.perf_counter() - started)
+        sim.set_profiler(profiler)
+    simulation_data["metadata"]["search"] = search
+    if search == "sample":
+        simulation_data["metadata"]["n_false_reports"] = n_false_reports
+        simulation_data["metadata"]["max_updates_per_student"] = max_updates_per_student
+    # seed 为空时检查点需要记录实际使用的随机种子
+    params["seed"] = seed
+    
+    # 存储有利的策略性案例
+    beneficial_cases = []
+    found_cases = 0
+    evaluated_cases = 0
+    total_scenarios = 0
+    beneficial_scenarios = 0
+    start_index = 0
+    if state is not None:
+        # 保留原始运行的 metadata（包括时间戳），使恢复后的结果与不中断的运行相同
+        simulation_data["metadata"] = state["metadata"]
+        beneficial_cases = state["beneficial_cases"]
+        found_cases = state["found_cases"]
+        evaluated_cases = state["evaluated_cases"]
+        total_scenarios = state["total_scenarios"]
+        beneficial_scenarios = state["beneficial_scenarios"]
+        start_index = state["next_case"]
+    
+    writer = None
+    if is_stream_path(output_path):
+        if state is not None:
+            writer = restore_stream_writer(output_path, found_cases, simulation_data["metadata"], 
+                                           sim.students, sim.schools)
+        else:
+            writer = open_result_writer(output_path, simulation_data["metadata"], 
+                                        sim.students, sim.schools)
+    
+    def write_checkpoint(next_case, completed=False):
+        save_checkpoint(checkpoint_path, {
+            "params": params,
+            "metadata": simulation_data["metadata"],
+            "next_case": next_case,
+            "found_cases": found_cases,
+            "evaluated_cases": evaluated_cases,
+            "total_scenarios": total_scenarios,
+            "beneficial_scenarios": beneficial_scenarios,
+            # 流式输出的有利案例已经在结果文件中
+            "beneficial_cases": beneficial_cases if writer is None else [],
+            "completed": completed
+        })
+    
+    last_checkpoint = time.perf_counter()
+    try:
+        # 遍历采样的偏好组合
+        for case_index in range(start_index, len(sampled_combinations)):
+            if found_cases >= max_cases:
                 break
+                
+            combination = sampled_combinations[case_index]
+            started = time.perf_counter()
+            case_data = evaluate_case(sim, case_index, combination, all_prefs, seed, search, 
+                                      n_false_reports, max_updates_per_student)
+            if profiler is not None:
+                profiler.add("evaluate", time.perf_counter() - started)
+            n_scenarios, n_beneficial = count_scenarios(case_data)
+            evaluated_cases += 1
+            total_scenarios += n_scenarios
+            beneficial_scenarios += n_beneficial
+            
+            if n_beneficial:
+                found_cases += 1
+                if writer is not None:
+                    started = time.perf_counter()
+                    writer.write_case(case_data)
+                    if profiler is not None:
+                        profiler.add("serialization", time.perf_counter() - started)
+                else:
+                    beneficial_cases.append(case_data)
+            if profiler is not None:
+                profiler.case_done(len(sampled_combinations))
+            if checkpoint_path is not None and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                write_checkpoint(case_index + 1)
+                last_checkpoint = time.perf_counter()
         
-        if has_beneficial_strategy:
-            beneficial_cases.append(case_data)
+        simulation_data["metadata"].update({
+            "max_cases": max_cases,
+            "evaluated_cases": evaluated_cases,
+            "total_scenarios": total_scenarios,
+            "beneficial_scenarios": beneficial_scenarios
+        })
+        if profiler is not None:
+            simulation_data["metadata"]["profile"] = profiler.report()
+        if writer is not None:
+            writer.close(simulation_data["metadata"])
+        if checkpoint_path is not None:
+            write_checkpoint(len(sampled_combinations), completed=True)
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    if writer is not None:
+        simulation_data["cases"] = open_cases(output_path)
+        return simulation_data, output_path
     
     # 保存数据到JSON文件
     simulation_data["cases"] = beneficial_cases
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"beneficial_simulation_results_{timestamp}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(simulation_data, f, indent=2, ensure_ascii=False)
+    started = time.perf_counter()
+    filename = save_simulation_data(simulation_data, output_path)
+    if profiler is not None:
+        # 文件中的 profile 不包括保存本身的时间，返回的 metadata 和汇总行中补上
+        seconds = time.perf_counter() - started
+        profiler.add("serialization", seconds)
+        simulation_data["metadata"]["profile"] = profiler.report()
+        if profiler.progress_interval is not None:
+            print(profiler.summary_line(filename, seconds))
     
     return simulation_data, filename
 
+def resume_simulation(checkpoint_path: str, profile: bool = False, progress_interval: float = 10.0, 
+                      checkpoint_interval: float = 60.0):
+    """用检查点中记录的参数从检查点继续运行 run_simulation"""
+    params = load_checkpoint(checkpoint_path)["params"]
+    return run_simulation(**params, profile=profile, progress_interval=progress_interval, 
+                          checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval, 
+                          resume=True)
+
 def analyze_results(simulation_data, filename: str):
-    """分析模拟结果并打印摘要"""
-    total_cases = len(simulation_data["cases"])
+    """分析模拟结果并打印摘要（cases 可以是列表，也可以是流式结果的惰性视图）"""
+    total_cases = 0
     beneficial_cases = 0
     total_scenarios = 0
     
-    for case in simulation_data["cases"]:
-        for strategy in case["strategic_scenarios"]:
-            for second_round in strategy["second_round_scenarios"]:
-                total_scenarios += 1
-                if second_round["outcome"]["is_beneficial"]:
-                    beneficial_cases += 1
+    if isinstance(simulation_data["cases"], BinaryResultStore):
+        # 二进制结果直接按字段统计，不还原为字典
+        summary = simulation_data["cases"].summary()
+        total_cases = summary["total_cases"]
+        total_scenarios = summary["total_scenarios"]
+        beneficial_cases = summary["beneficial_scenarios"]
+    else:
+        for case in simulation_data["cases"]:
+            total_cases += 1
+            for strategy in case["strategic_scenarios"]:
+                for second_round in strategy["second_round_scenarios"]:
+                    total_scenarios += 1
+                    if second_round["outcome"]["is_beneficial"]:
+                        beneficial_cases += 1
                 
     print(f"\n模拟结果摘要:")
     print(f"总案例数: {total_cases}")
     print(f"总策略组合数: {total_scenarios}")
     print(f"发现的有利策略性操作案例数: {beneficial_cases}")
-    print(f"有利策略比例: {beneficial_cases/total_scenarios:.2%}")
+    print(f"有利策略比例: {beneficial_cases/total_scenarios if total_scenarios else 0:.2%}")
     print(f"详细结果已保存到: {filename}")
 
 def save_first_beneficial_case(simulation_data: dict):
@@ -241,20 +446,14 @@ def save_first_beneficial_case(simulation_data: dict):
     print("未找到有利的策略性操作案例")
     return None
 
-def save_all_beneficial_cases(simulation_data: dict):
-    """
-    查找并保存所有包含有利策略的案例
-    """
-    beneficial_cases = []
-    
+def _iter_beneficial_cases(simulation_data: dict):
+    """逐个生成包含有利策略的案例及其全部有利策略"""
     for case in simulation_data["cases"]:
-        case_has_beneficial_strategy = False
         beneficial_strategies = []
         
         for strategy in case["strategic_scenarios"]:
             for second_round in strategy["second_round_scenarios"]:
                 if second_round["outcome"]["is_beneficial"]:
-                    case_has_beneficial_strategy = True
                     beneficial_strategy = {
                         "false_preference": strategy["false_preference"],
                         "first_round": strategy["first_round"],
@@ -262,18 +461,44 @@ def save_all_beneficial_cases(simulation_data: dict):
                     }
                     beneficial_strategies.append(beneficial_strategy)
         
-        if case_has_beneficial_strategy:
-            beneficial_case = {
+        if beneficial_strategies:
+            yield {
                 "case_id": case["case_id"],
                 "initial_setup": case["initial_setup"],
                 "honest_scenario": case["honest_scenario"],
                 "beneficial_strategies": beneficial_strategies
             }
-            beneficial_cases.append(beneficial_case)
+
+def save_all_beneficial_cases(simulation_data: dict):
+    """
+    查找并保存所有包含有利策略的案例
+    
+    输入为流式结果（JSONL或二进制）时，结果也逐条写入JSONL文件，不在内存中累积。
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    cases = simulation_data["cases"]
+    
+    if isinstance(cases, (StreamedCases, BinaryResultStore)):
+        suffix = ".jsonl.gz" if cases.path.endswith(".gz") else ".jsonl"
+        filename = f"all_beneficial_cases_{timestamp}{suffix}"
+        writer = JsonlResultWriter(filename, {"timestamp": datetime.now().isoformat()})
+        try:
+            for beneficial_case in _iter_beneficial_cases(simulation_data):
+                writer.write_case(beneficial_case)
+            writer.close({"total_beneficial_cases": writer.case_count})
+        finally:
+            writer.close()
+        
+        if writer.case_count:
+            print(f"已找到 {writer.case_count} 个有利案例并保存到: {filename}")
+            return StreamedCases(filename)
+        print("未找到有利的策略性操作案例")
+        return None
+    
+    beneficial_cases = list(_iter_beneficial_cases(simulation_data))
     
     if beneficial_cases:
         # 保存到新的JSON文件
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"all_beneficial_cases_{timestamp}.json"
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump({
@@ -291,7 +516,25 @@ def save_all_beneficial_cases(simulation_data: dict):
         return None
 
 if __name__ == "__main__":
-    results, filename = run_simulation()
+    import argparse
+    parser = argparse.ArgumentParser(description="运行两轮匹配的策略性操作模拟")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sample-size", type=int, default=50)
+    parser.add_argument("--max-cases", type=int, default=3)
+    parser.add_argument("--output", default=None, help="结果文件名（.json/.jsonl/.jsonl.gz/.sqbm）")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件名")
+    parser.add_argument("--checkpoint-interval", type=float, default=60.0, help="写入检查点的间隔秒数")
+    parser.add_argument("--resume", metavar="CHECKPOINT", default=None, 
+                        help="从检查点继续运行，使用检查点中记录的参数")
+    args = parser.parse_args()
+    
+    if args.resume:
+        results, filename = resume_simulation(args.resume, checkpoint_interval=args.checkpoint_interval)
+    else:
+        results, filename = run_simulation(seed=args.seed, sample_size=args.sample_size, 
+                                           max_cases=args.max_cases, output_path=args.output, 
+                                           checkpoint_path=args.checkpoint, 
+                                           checkpoint_interval=args.checkpoint_interval)
     analyze_results(results, filename)
     save_first_beneficial_case(results)
     save_all_beneficial_cases(results) 
\ No newline at end of file
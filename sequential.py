@@ -0,0 +1,160 @@
+"""序贯估计：不断抽取偏好组合，直到有利策略比例的置信区间宽度达到要求或时间用完
+
+与 run_simulation 不同，这里不在找到 max_cases 个有利案例后停止（这种停止规则会使比例估计有偏），
+而是按固定间隔检查置信区间的宽度，只计算达到所需精度的案例数。
+
+偏好组合从整个组合空间中有放回地独立抽取（按混合进制编号，见 preference_space），
+第 i 个组合和第 i 个案例的随机数生成器都由 (seed, i) 决定，相同 seed 下结果可以复现。
+
+停止时使用的区间宽度取按案例聚类的区间（见 estimation）和把策略组合当作独立样本的 Wilson 区间中较宽的一个，
+避免开始时有利案例很少、样本方差为0时过早停止。有利策略很少见，方差估计在案例数少时不稳定，
+所以默认至少计算1000个案例才开始检查（4x4市场上这样区间的实际覆盖率与名义水平相符）。
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+from math import prod
+from typing import List
+
+from best_response import check_report_space
+from estimation import RateEstimator, wilson_interval
+from preference_space import decode_product_index
+from run_matching import count_scenarios, evaluate_case, prepare_simulation
+from sweep import parse_market
+
+
+def _interval_width(estimator: RateEstimator, metric: str, level: float) -> float:
+    if metric == "case_rate":
+        low, high = estimator.case_interval(level)
+        return high - low
+    low, high = estimator.confidence_interval(level)
+    wilson_low, wilson_high = wilson_interval(estimator.beneficial, estimator.total, level)
+    return max(high - low, wilson_high - wilson_low)
+
+
+def run_sequential(seed: int = None, target_width: float = 0.01, time_budget: float = None,
+                   max_profiles: int = None, level: float = 0.95, metric: str = "rate",
+                   min_cases: int = 1000, check_every: int = 100, n_students: int = 4,
+                   n_schools: int = 4, capacities: List[int] = None, max_perms: int = 6,
+                   search: str = "sample", n_false_reports: int = 3, max_updates_per_student: int = 1,
+                   cache_size: int = 0, progress_interval: float = 10.0) -> dict:
+    """
+    序贯地估计有利策略比例，返回包含 metadata 和估计结果的字典
+
+    metric 为 "rate"（有利策略组合比例）或 "case_rate"（有利案例比例），决定停止时检查哪个区间。
+    至少计算 min_cases 个案例后，每 check_every 个案例检查一次：区间宽度不超过 target_width、
+    用时超过 time_budget 秒或案例数达到 max_profiles 时停止。
+    metric 为 "rate" 且检查时还没有任何策略组合（例如只有1所学校，s1 只能诚实申报）时，
+    比例没有定义、区间不会缩小，以 stop_reason "no_scenarios" 停止。
+    cache_size 大于0时启用DA结果缓存，默认关闭：有放回地独立抽样时重复的偏好组合很少。
+    """
+    if metric not in ("rate", "case_rate"):
+        raise ValueError(f"未知的估计指标: {metric}")
+    if time_budget is None and max_profiles is None and target_width <= 0:
+        raise ValueError("target_width 为0时必须设置 time_budget 或 max_profiles")
+
+    if search == "best_response":
+        check_report_space(n_schools)
+    sim, all_prefs, _, simulation_data = prepare_simulation(
+        seed, 0, cache_size, n_students, n_schools, capacities, max_perms)
+    seed = simulation_data["metadata"]["seed"]
+    # 有放回抽样，没有固定的样本量
+    del simulation_data["metadata"]["sample_size"]
+    preference_spaces = ([all_prefs[student] for student in sim.students[1:]] +
+                         [all_prefs[school] for school in sim.schools])
+    total_combinations = prod(len(space) for space in preference_spaces)
+
+    estimator = RateEstimator()
+    started = last_progress = time.perf_counter()
+    stop_reason = None
+    width = float('inf')
+    case_index = 0
+    while stop_reason is None:
+        index = random.Random(f"{seed}:profile:{case_index}").randrange(total_combinations)
+        combination = decode_product_index(index, preference_spaces)
+        case_data = evaluate_case(sim, case_index, combination, all_prefs, seed, search,
+                                  n_false_reports, max_updates_per_student)
+        estimator.add(*count_scenarios(case_data))
+        case_index += 1
+
+        now = time.perf_counter()
+        if case_index >= min_cases and case_index % check_every == 0:
+            width = _interval_width(estimator, metric, level)
+            if width <= target_width:
+                stop_reason = "target_width"
+            elif metric == "rate" and estimator.total == 0:
+                stop_reason = "no_scenarios"
+        if stop_reason is None and max_profiles is not None and case_index >= max_profiles:
+            stop_reason = "max_profiles"
+        if stop_reason is None and time_budget is not None and now - started >= time_budget:
+            stop_reason = "time_budget"
+        if progress_interval is not None and now - last_progress >= progress_interval:
+            last_progress = now
+            print(f"[进度] 已计算 {case_index} 个案例，{metric} = {getattr(estimator, metric):.4f}，"
+                  f"区间宽度 {width:.4f}（目标 {target_width}）")
+
+    width = _interval_width(estimator, metric, level)
+    simulation_data["metadata"].update({
+        "mode": "sequential",
+        "search": search,
+        "metric": metric,
+        "target_width": target_width,
+        "time_budget": time_budget,
+        "max_profiles": max_profiles,
+        "level": level,
+        "stop_reason": stop_reason,
+        "interval_width": width,
+        "wall_seconds": time.perf_counter() - started
+    })
+    if search == "sample":
+        simulation_data["metadata"]["n_false_reports"] = n_false_reports
+        simulation_data["metadata"]["max_updates_per_student"] = max_updates_per_student
+    return {"metadata": simulation_data["metadata"], "estimate": estimator.summary(level)}
+
+
+def save_sequential_results(results: dict, filename: str = None) -> str:
+    if filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"sequential_results_{timestamp}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    return filename
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="序贯估计有利策略比例，直到置信区间达到要求的宽度")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--target-width", type=float, default=0.01, help="置信区间的目标宽度")
+    parser.add_argument("--time-budget", type=float, default=None, help="最多运行的秒数")
+    parser.add_argument("--max-profiles", type=int, default=None, help="最多计算的案例数")
+    parser.add_argument("--level", type=float, default=0.95, help="置信水平")
+    parser.add_argument("--metric", choices=["rate", "case_rate"], default="rate")
+    parser.add_argument("--market", default="4x4", help="市场规模，如 4x4 或 6x3:2,2,2")
+    parser.add_argument("--search", choices=["sample", "best_response"], default="sample",
+                        help="best_response 检查 s1 的全部申报，只支持不超过8所学校的小市场")
+    parser.add_argument("--n-false-reports", type=int, default=3)
+    parser.add_argument("--max-updates", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    n_students, n_schools, capacities = parse_market(args.market)
+    results = run_sequential(args.seed, args.target_width, args.time_budget, args.max_profiles,
+                             args.level, args.metric, n_students=n_students, n_schools=n_schools,
+                             capacities=list(capacities), search=args.search,
+                             n_false_reports=args.n_false_reports,
+                             max_updates_per_student=args.max_updates)
+    estimate = results["estimate"]
+    print(f"\n序贯估计结果（停止原因: {results['metadata']['stop_reason']}）:")
+    print(f"案例数: {estimate['cases']}")
+    print(f"总策略组合数: {estimate['total_scenarios']}")
+    print(f"有利策略比例: {estimate['rate']:.4%} "
+          f"[{estimate['ci_low']:.4%}, {estimate['ci_high']:.4%}]")
+    print(f"有利案例比例: {estimate['case_rate']:.4%} "
+          f"[{estimate['case_ci_low']:.4%}, {estimate['case_ci_high']:.4%}]")
+    print(f"详细结果已保存到: {save_sequential_results(results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
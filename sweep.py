@@ -0,0 +1,190 @@
+"""参数扫描
+
+对 sample_size、max_cases、n_false_reports、max_updates_per_student 和市场规模的网格运行模拟，
+按网格点汇总有利策略比例及其置信区间（见 estimation），输出一张表。
+
+相同 (市场, seed, sample_size) 的网格点共用一次 prepare_simulation 的结果（采样的偏好排列和偏好组合），
+在同一个工作进程中逐个案例地依次计算各组参数：同一案例的学校偏好相同，学校排名表只构造一次。
+DA结果缓存默认关闭；用 --cache-size 启用后，诚实申报等重复的DA求解由 MatchingSimulation 的
+结果缓存复用。每组参数的结果与用相同参数单独调用 run_simulation 完全相同。
+不同 seed 作为重复运行合并到同一个网格点。
+
+命令行示例：
+    python sweep.py --markets 4x4 5x3:2,2,1 --seeds 0 1 2 --sample-sizes 200 \\
+        --n-false-reports 1 3 5 --max-updates 1 2 --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import product
+from typing import List, Tuple
+
+from estimation import RateEstimator
+from matching_simulation import MatchingSimulation
+from preference_space import get_update_table
+from run_matching import count_scenarios, evaluate_case, prepare_simulation
+
+# 表格中的参数列
+PARAMETER_COLUMNS = ["market", "sample_size", "max_cases", "n_false_reports", "max_updates_per_student"]
+
+
+def parse_market(spec: str) -> Tuple[int, int, Tuple[int, ...]]:
+    """解析 "4x4" 或 "6x3:2,2,2"（学生数x学校数:各学校名额）形式的市场规模"""
+    size, _, quota = spec.partition(':')
+    n_students, n_schools = (int(part) for part in size.lower().split('x'))
+    capacities = tuple(int(part) for part in quota.split(',')) if quota else (1,) * n_schools
+    if len(capacities) != n_schools:
+        raise ValueError(f"市场 {spec} 的名额个数与学校数不一致")
+    return n_students, n_schools, capacities
+
+
+def _run_group(task: Tuple) -> List[Tuple[Tuple, RateEstimator, float]]:
+    """
+    计算共用同一批偏好组合的一组网格点
+
+    variants 为 [(max_cases, n_false_reports, max_updates_per_student), ...]，
+    max_cases 为空表示计算全部采样的案例。返回 [(variant, 估计量, 秒数), ...]。
+    """
+    market, seed, sample_size, max_perms, variants, cache_size = task
+    n_students, n_schools, capacities = parse_market(market)
+    sim, all_prefs, sampled_combinations, _ = prepare_simulation(
+        seed, sample_size, cache_size, n_students, n_schools, list(capacities), max_perms)
+
+    estimators = [RateEstimator() for _ in variants]
+    seconds = [0.0] * len(variants)
+    for case_index, combination in enumerate(sampled_combinations):
+        active = [i for i, (max_cases, _, _) in enumerate(variants)
+                  if max_cases is None or estimators[i].beneficial_cases < max_cases]
+        if not active:
+            break
+        for i in active:
+            _, n_false_reports, max_updates_per_student = variants[i]
+            started = time.perf_counter()
+            case_data = evaluate_case(sim, case_index, combination, all_prefs, seed, "sample",
+                                      n_false_reports, max_updates_per_student)
+            estimators[i].add(*count_scenarios(case_data))
+            seconds[i] += time.perf_counter() - started
+    return list(zip(variants, estimators, seconds))
+
+
+def run_sweep(markets: List[str] = ("4x4",), seeds: List[int] = (0,), sample_sizes: List[int] = (50,),
+              max_cases_values: List[int] = (None,), n_false_reports_values: List[int] = (3,),
+              max_updates_values: List[int] = (1,), max_perms: int = 6, workers: int = None,
+              cache_size: int = 0, level: float = 0.95) -> List[dict]:
+    """
+    运行参数网格，返回每个网格点一行的汇总结果（不同 seed 合并）
+
+    任务按 (市场, seed, sample_size) 分组后在进程池中执行，workers 为1时在当前进程中执行。
+    cache_size 为每个工作进程的DA结果缓存条目数，默认0表示不启用缓存。
+    """
+    variants = list(product(max_cases_values, n_false_reports_values, max_updates_values))
+    tasks = [(market, seed, sample_size, max_perms, variants, cache_size)
+             for market, seed, sample_size in product(markets, seeds, sample_sizes)]
+
+    # 在创建进程池之前填满各市场的更新表，fork 出的工作进程直接共用
+    for market in markets:
+        n_students, n_schools, capacities = parse_market(market)
+        get_update_table(MatchingSimulation(n_students, n_schools, list(capacities)).schools).precompute()
+
+    if workers == 1:
+        group_results = [_run_group(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            group_results = list(pool.map(_run_group, tasks))
+
+    # 按网格点合并不同 seed 的结果，保持网格的顺序
+    merged = {}
+    for task, results in zip(tasks, group_results):
+        market, _, sample_size = task[:3]
+        for variant, estimator, seconds in results:
+            key = (market, sample_size) + variant
+            if key not in merged:
+                merged[key] = [RateEstimator(), 0.0, 0]
+            merged[key][0].merge(estimator)
+            merged[key][1] += seconds
+            merged[key][2] += 1
+
+    rows = []
+    for key, (estimator, seconds, runs) in merged.items():
+        row = dict(zip(PARAMETER_COLUMNS, key))
+        row.update(runs=runs, seconds=seconds)
+        row.update(estimator.summary(level))
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: List[dict]) -> str:
+    """把汇总结果格式化为文字表格"""
+    header = (f"{'market':<12}{'sample':>7}{'max':>6}{'false':>6}{'upd':>5}{'cases':>8}{'scenarios':>11}"
+              f"{'rate':>9}  {'ci':<20}{'case_rate':>10}")
+    lines = [header]
+    for row in rows:
+        max_cases = row["max_cases"] if row["max_cases"] is not None else "all"
+        lines.append(
+            f"{row['market']:<12}{row['sample_size']:>7}{max_cases:>6}{row['n_false_reports']:>6}"
+            f"{row['max_updates_per_student']:>5}{row['cases']:>8}{row['total_scenarios']:>11}"
+            f"{row['rate']:>9.4f}  [{row['ci_low']:.4f}, {row['ci_high']:.4f}]  "
+            f"{row['case_rate']:>10.4f}")
+    return "\n".join(lines)
+
+
+def save_sweep_results(rows: List[dict], metadata: dict, filename: str = None) -> str:
+    """保存汇总结果，文件名以 .csv 结尾时保存为CSV，否则保存为JSON"""
+    if filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"sweep_results_{timestamp}.json"
+    if filename.endswith('.csv'):
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else PARAMETER_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({"metadata": metadata, "rows": rows}, f, indent=2, ensure_ascii=False)
+    return filename
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="对模拟参数的网格运行模拟并汇总有利策略比例")
+    parser.add_argument("--markets", nargs="+", default=["4x4"],
+                        help="市场规模，如 4x4 或 6x3:2,2,2（学生数x学校数:各学校名额）")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0], help="随机种子，合并为重复运行")
+    parser.add_argument("--sample-sizes", nargs="+", type=int, default=[50])
+    parser.add_argument("--max-cases", nargs="+", type=int, default=[None],
+                        help="找到多少个有利案例后停止，默认计算全部采样的案例")
+    parser.add_argument("--n-false-reports", nargs="+", type=int, default=[3])
+    parser.add_argument("--max-updates", nargs="+", type=int, default=[1])
+    parser.add_argument("--max-perms", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="每个工作进程的DA结果缓存大小，默认0表示关闭；缓存按条目计数，大市场中每条约占数KB")
+    parser.add_argument("--level", type=float, default=0.95, help="置信水平")
+    parser.add_argument("--output", default=None, help="结果文件名（.json 或 .csv）")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows = run_sweep(args.markets, args.seeds, args.sample_sizes, args.max_cases, args.n_false_reports,
+                     args.max_updates, args.max_perms, args.workers, args.cache_size, args.level)
+    metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "markets": args.markets,
+        "seeds": args.seeds,
+        "sample_sizes": args.sample_sizes,
+        "max_cases": args.max_cases,
+        "n_false_reports": args.n_false_reports,
+        "max_updates_per_student": args.max_updates,
+        "max_perms": args.max_perms,
+        "level": args.level,
+        "wall_seconds": time.perf_counter() - started
+    }
+    print(format_table(rows))
+    filename = save_sweep_results(rows, metadata, args.output)
+    print(f"扫描结果已保存到: {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""DA引擎、热启动、稳定匹配格、第二轮更新采样和最优反应搜索的随机对照测试
+
+每个引擎都与原始实现 _da_algorithm_legacy 或逐个枚举全部匹配得到的稳定匹配集合比较。
+运行：python -m pytest -q test_engines.py
+"""
+import random
+from itertools import permutations, product
+
+import pytest
+
+from best_response import best_response_case
+from da_engine import IncrementalDA, build_rank_table, da_algorithm_batch, da_int, np
+from lattice import StableLattice, is_stable
+from matching_simulation import MatchingSimulation
+from preference_space import UpdateTable
+from run_matching import run_simulation
+
+
+def random_market(rng: random.Random, max_students: int = 6, max_schools: int = 5,
+                  complete: bool = None, unit: bool = None):
+    """随机市场：学生偏好（可以不完整）、学校偏好（全体学生的排列）和名额"""
+    n_students = rng.randint(1, max_students)
+    n_schools = rng.randint(1, max_schools)
+    if complete is None:
+        complete = rng.random() < 0.5
+    if unit is None:
+        unit = rng.random() < 0.5
+    student_prefs = []
+    for _ in range(n_students):
+        pref = rng.sample(range(n_schools), n_schools)
+        student_prefs.append(pref if complete else pref[:rng.randint(0, n_schools)])
+    school_prefs = [rng.sample(range(n_students), n_students) for _ in range(n_schools)]
+    capacities = [1] * n_schools if unit else [rng.randint(0, 3) for _ in range(n_schools)]
+    return student_prefs, school_prefs, capacities
+
+
+def brute_force_stable(student_prefs, school_ranks, capacities):
+    """逐个检查全部匹配，返回稳定匹配的集合"""
+    options = [[-1] + list(pref) for pref in student_prefs]
+    return {matching for matching in product(*options)
+            if is_stable(matching, student_prefs, school_ranks, capacities)}
+
+
+def legacy_da(student_prefs, school_prefs, capacities):
+    """用原始实现求解整数编码的市场"""
+    sim = MatchingSimulation(len(student_prefs), len(school_prefs), capacities)
+    matching = sim._da_algorithm_legacy(
+        {sim.students[s]: [sim.schools[c] for c in pref] for s, pref in enumerate(student_prefs)},
+        {sim.schools[c]: [sim.students[s] for s in pref] for c, pref in enumerate(school_prefs)})
+    return [sim.schools.index(matching[student]) if student in matching else -1
+            for student in sim.students]
+
+
+def test_da_int_matches_legacy_and_is_student_optimal():
+    rng = random.Random(1)
+    for _ in range(500):
+        student_prefs, school_prefs, capacities = random_market(rng)
+        ranks = build_rank_table(school_prefs, len(student_prefs))
+        unit = all(capacity == 1 for capacity in capacities)
+        matching = da_int(student_prefs, ranks, None if unit else capacities)
+        assert matching == legacy_da(student_prefs, school_prefs, capacities)
+
+        stable = brute_force_stable(student_prefs, ranks, capacities)
+        assert tuple(matching) in stable
+        # 学生最优：每个学生都弱偏好DA的结果
+        for other in stable:
+            for student, pref in enumerate(student_prefs):
+                position = pref.index(matching[student]) if matching[student] != -1 else len(pref)
+                if other[student] != -1:
+                    assert position <= pref.index(other[student])
+
+
+@pytest.mark.skipif(np is None, reason="批量引擎需要 numpy")
+def test_batch_matches_da_int():
+    rng = random.Random(2)
+    for n_students, n_schools in [(1, 1), (4, 4), (6, 3), (3, 7)]:
+        student_prefs = [[rng.sample(range(n_schools), n_schools) for _ in range(n_students)]
+                         for _ in range(50)]
+        school_prefs = [[rng.sample(range(n_students), n_students) for _ in range(n_schools)]
+                        for _ in range(50)]
+        batch = da_algorithm_batch(student_prefs, school_prefs).tolist()
+        for students, schools, matching in zip(student_prefs, school_prefs, batch):
+            assert matching == da_int(students, build_rank_table(schools, n_students))
+
+
+def test_incremental_update_matches_full_solve():
+    rng = random.Random(3)
+    for _ in range(300):
+        student_prefs, school_prefs, capacities = random_market(rng, max_students=8)
+        n_students, n_schools = len(student_prefs), len(school_prefs)
+        ranks = build_rank_table(school_prefs, n_students)
+        order = rng.sample(range(n_students), n_students)
+        solver = IncrementalDA(ranks, capacities)
+        assert solver.solve(student_prefs, order) == da_int(student_prefs, ranks, capacities)
+
+        current = [list(pref) for pref in student_prefs]
+        for _ in range(5):
+            # 随机修改若干学生的偏好，有时从副本继续，原求解器保持不变
+            changes = {student: rng.sample(range(n_schools), rng.randint(0, n_schools))
+                       for student in rng.sample(range(n_students), rng.randint(1, n_students))}
+            if rng.random() < 0.3:
+                before = solver.matching
+                branch = solver.copy()
+                updated = [changes.get(student, pref) for student, pref in enumerate(current)]
+                expected = da_int(updated, ranks, capacities)
+                assert branch.update(changes) == expected
+                assert solver.matching == before
+                continue
+            for student, pref in changes.items():
+                current[student] = pref
+            assert solver.update(changes) == da_int(current, ranks, capacities)
+
+
+def test_lattice_matches_brute_force():
+    rng = random.Random(4)
+    for _ in range(400):
+        student_prefs, school_prefs, capacities = random_market(rng)
+        ranks = build_rank_table(school_prefs, len(student_prefs))
+        lattice = StableLattice(student_prefs, ranks, capacities)
+        matchings = [tuple(matching) for matching in lattice]
+        stable = brute_force_stable(student_prefs, ranks, capacities)
+        assert len(matchings) == len(set(matchings))
+        assert set(matchings) == stable
+        assert tuple(lattice.student_optimal) == tuple(da_int(student_prefs, ranks, capacities))
+        assert tuple(lattice.school_optimal) in stable
+        for student in range(len(student_prefs)):
+            assert lattice.stable_schools(student) == {m[student] for m in stable} - {-1}
+
+
+def test_lattice_complete_markets():
+    rng = random.Random(5)
+    for _ in range(50):
+        n = rng.randint(5, 7)
+        student_prefs = [rng.sample(range(n), n) for _ in range(n)]
+        ranks = build_rank_table([rng.sample(range(n), n) for _ in range(n)], n)
+        stable = {perm for perm in permutations(range(n)) if is_stable(perm, student_prefs, ranks)}
+        assert {tuple(matching) for matching in StableLattice(student_prefs, ranks)} == stable
+
+
+def test_update_table_matches_generated_updates():
+    rng = random.Random(7)
+    for n_schools in range(1, 7):
+        sim = MatchingSimulation(8, n_schools)
+        lazy, full = UpdateTable(sim.schools), UpdateTable(sim.schools)
+        assert full.precompute() and full.complete and not lazy.complete
+        for _ in range(200):
+            prefs = {student: rng.sample(sim.schools, n_schools) for student in sim.students}
+            matching = {student: rng.choice(prefs[student]) for student in sim.students
+                        if rng.random() < 0.8}
+            generated = sim._generate_updated_preferences(matching, prefs)
+            others = sim.students[1:]
+            items = [matching.get(student) for student in others]
+            indices = [lazy.index(prefs[student]) for student in others]
+            for student, index, item in zip(others, indices, items):
+                assert [list(lazy.perm(update)) for update in lazy.updates(index, item)] == generated[student]
+            # 各种采样方式选中的更新和随机数的使用都与对完整候选列表调用 rng.sample 相同
+            k = rng.randint(0, n_schools + 1)
+            seed = rng.random()
+            expected_rng = random.Random(seed)
+            expected = [expected_rng.sample(generated[student], min(k, len(generated[student])))
+                        for student in others]
+            by_index = random.Random(seed)
+            assert [[list(full.perm(update)) for update in full.sample_updates(index, item, k, by_index)]
+                    for index, item in zip(indices, items)] == expected
+            from_lists = random.Random(seed)
+            assert [lazy.sample_perms(prefs[student], item, k, from_lists)
+                    for student, item in zip(others, items)] == expected
+            from_table = random.Random(seed)
+            assert full.sample_update_lists(indices, items, k, from_table) == expected
+            sampled = sim.sample_updated_preferences(matching, prefs, k, random.Random(seed))
+            assert [sampled[student] for student in others] == expected
+            assert (by_index.random() == from_lists.random() == from_table.random() == 
+                    expected_rng.random())
+
+
+def brute_force_case(sim, combination, reports):
+    """逐个计算每个虚假申报和每个第二轮更新组合，返回 {(申报, 更新组合): s1 的第二轮学校}"""
+    s1, others = sim.students[0], sim.students[1:]
+    honest_prefs = {s1: sim.s1_true_pref}
+    honest_prefs.update({student: list(pref) for student, pref in zip(others, combination)})
+    school_prefs = {school: list(pref) for school, pref in zip(sim.schools, combination[len(others):])}
+    honest = sim.da_algorithm(honest_prefs, school_prefs)
+    outcomes = {}
+    for report in reports:
+        if list(report) == sim.s1_true_pref:
+            continue
+        first_prefs = dict(honest_prefs, **{s1: list(report)})
+        first = sim.da_algorithm(first_prefs, school_prefs)
+        if first == honest:
+            continue
+        updates = sim.generate_updated_preferences(first, first_prefs)
+        for updated in product(*(updates[student] for student in others)):
+            second_prefs = {s1: sim.s1_true_pref}
+            second_prefs.update(zip(others, updated))
+            outcomes[tuple(report), tuple(map(tuple, updated))] = \
+                sim.da_algorithm(second_prefs, school_prefs).get(s1)
+    return outcomes
+
+
+def search_outcomes(sim, case_data):
+    """把 best_response_case 的结果整理成与 brute_force_case 相同的格式"""
+    return {(tuple(strategy["false_preference"]),
+             tuple(tuple(second_round["updated_preferences"][student]) for student in sim.students[1:])):
+            second_round["matching"].get(sim.students[0])
+            for strategy in case_data["strategic_scenarios"]
+            for second_round in strategy["second_round_scenarios"]}
+
+
+def test_best_response_matches_brute_force():
+    sim = MatchingSimulation()
+    rng = random.Random(6)
+    all_prefs = sim.generate_all_preferences(rng)
+    for case_index in range(60):
+        combination = tuple(rng.choice(all_prefs[name]) for name in sim.students[1:] + sim.schools)
+        # 默认搜索 s1 的全部排列，也可以只搜索给定的申报
+        case_data = best_response_case(sim, case_index, combination)
+        assert search_outcomes(sim, case_data) == brute_force_case(sim, combination, permutations(sim.schools))
+        reports = all_prefs[sim.students[0]]
+        case_data = best_response_case(sim, case_index, combination, reports)
+        assert search_outcomes(sim, case_data) == brute_force_case(sim, combination, reports)
+
+
+def test_best_response_rejects_large_report_space():
+    sim = MatchingSimulation(3, 9)
+    combination = tuple([tuple(sim.schools)] * 2 + [tuple(sim.students)] * 9)
+    with pytest.raises(ValueError):
+        best_response_case(sim, 0, combination)
+    # 显式给出申报时不受限制
+    reports = [list(reversed(sim.schools))]
+    case_data = best_response_case(sim, 0, combination, reports)
+    assert search_outcomes(sim, case_data) == brute_force_case(sim, combination, reports)
+    with pytest.raises(ValueError):
+        run_simulation(seed=0, sample_size=1, n_students=3, n_schools=9, search="best_response")
@@ -0,0 +1,131 @@
+"""模拟运行和结果文件格式的测试
+
+运行：python -m pytest -q test_results.py
+"""
+import json
+
+import pytest
+
+import run_matching
+from checkpoint import restore_stream_writer
+from matching_simulation import MatchingSimulation
+from result_io import load_simulation_stream, open_result_writer
+from result_store import DATA_OFFSET, BinaryResultStore, BinaryResultWriter
+from run_matching import resume_simulation, run_simulation
+from sequential import run_sequential
+
+
+def test_binary_strategy_index_above_uint16(tmp_path):
+    # best_response 搜索的一个案例可以有超过 65535 种虚假申报，只有最后一种写入记录
+    sim = MatchingSimulation()
+    prefs = {student: list(sim.schools) for student in sim.students}
+    school_prefs = {school: list(sim.students) for school in sim.schools}
+    matching = dict(zip(sim.students, sim.schools))
+    second_round = {"updated_preferences": prefs, "matching": matching,
+                    "outcome": {"is_beneficial": True}}
+    strategies = [{"false_preference": list(reversed(sim.schools)),
+                   "first_round": {"preferences": prefs, "matching": matching},
+                   "second_round_scenarios": []} for _ in range(70000)]
+    strategies[-1]["second_round_scenarios"].append(second_round)
+    case_data = {"case_id": 0,
+                 "initial_setup": {"student_preferences": prefs, "school_preferences": school_prefs},
+                 "honest_scenario": {"first_round": {"preferences": prefs, "matching": matching}},
+                 "strategic_scenarios": strategies}
+
+    path = str(tmp_path / "results.sqbm")
+    with BinaryResultWriter(path, {}, sim.students, sim.schools) as writer:
+        writer.write_case(case_data)
+    store = BinaryResultStore(path)
+    assert list(store.column("strategy_index")) == [69999]
+
+
+def test_sequential_stops_without_scenarios():
+    # 只有1所学校时 s1 的唯一申报就是真实偏好，不会产生任何策略组合
+    results = run_sequential(seed=0, n_students=3, n_schools=1, min_cases=50, check_every=10,
+                             progress_interval=None)
+    assert results["metadata"]["stop_reason"] == "no_scenarios"
+    assert results["estimate"]["total_scenarios"] == 0
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _serialized(path):
+    """结果文件中除时间戳以外的全部内容：(元数据, 按原样序列化的案例)"""
+    if path.endswith(".json"):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        data["metadata"].pop("timestamp")
+        return data["metadata"], json.dumps(data["cases"], ensure_ascii=False)
+    metadata = dict(load_simulation_stream(path)["metadata"])
+    metadata.pop("timestamp")
+    if path.endswith(".sqbm"):
+        with open(path, 'rb') as f:
+            f.seek(DATA_OFFSET)
+            return metadata, f.read()
+    with open(path, encoding='utf-8') as f:
+        return metadata, [line for line in f if line.startswith('{"case"')]
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl", ".sqbm"])
+def test_resume_matches_uninterrupted_run(tmp_path, monkeypatch, suffix):
+    params = {"seed": 3, "sample_size": 400, "max_cases": 400}
+    full_path = str(tmp_path / ("full" + suffix))
+    run_simulation(**params, output_path=full_path)
+
+    # 在第200个案例时中断；检查点只更新到第100个案例，之后写入结果文件的有利案例（128、179）
+    # 恢复时要被截掉并重新计算
+    evaluate_case, save_checkpoint = run_matching.evaluate_case, run_matching.save_checkpoint
+
+    def interrupting_evaluate(sim, case_index, *args):
+        if case_index == 200:
+            raise _Interrupted
+        return evaluate_case(sim, case_index, *args)
+
+    def lagging_checkpoint(path, state):
+        if state["next_case"] <= 100:
+            save_checkpoint(path, state)
+
+    path = str(tmp_path / ("resumed" + suffix))
+    checkpoint_path = str(tmp_path / "run.ckpt")
+    monkeypatch.setattr(run_matching, "evaluate_case", interrupting_evaluate)
+    monkeypatch.setattr(run_matching, "save_checkpoint", lagging_checkpoint)
+    with pytest.raises(_Interrupted):
+        run_simulation(**params, output_path=path, checkpoint_path=checkpoint_path,
+                       checkpoint_interval=0)
+    monkeypatch.undo()
+
+    resumed, _ = resume_simulation(checkpoint_path)
+    assert resumed["metadata"]["evaluated_cases"] == 400
+    assert _serialized(path) == _serialized(full_path)
+    if suffix == ".json":
+        full = run_simulation(**params, output_path=str(tmp_path / "again.json"))[0]
+        assert resumed["cases"] == full["cases"]
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz", ".sqbm"])
+def test_stream_round_trip_and_restore(tmp_path, suffix):
+    full_path = str(tmp_path / ("full" + suffix))
+    simulation_data, _ = run_simulation(seed=3, sample_size=400, max_cases=400, output_path=full_path)
+    cases = list(simulation_data["cases"])
+    expected, _ = run_simulation(seed=3, sample_size=400, max_cases=400,
+                                 output_path=str(tmp_path / "full.json"))
+    assert len(cases) == 8
+    assert cases == expected["cases"]
+
+    # 只保留前3个案例后继续写入，得到的文件与直接写入相同
+    sim = MatchingSimulation()
+    metadata = load_simulation_stream(full_path)["metadata"]
+    writer = restore_stream_writer(full_path, 3, metadata, sim.students, sim.schools)
+    assert writer.case_count == 3
+    for case_data in cases[3:]:
+        writer.write_case(case_data)
+    writer.close(metadata)
+    assert list(load_simulation_stream(full_path)["cases"]) == cases
+
+    path = str(tmp_path / ("short" + suffix))
+    with open_result_writer(path, metadata, sim.students, sim.schools) as writer:
+        writer.write_case(cases[0])
+    with pytest.raises(ValueError):
+        restore_stream_writer(path, 2, metadata, sim.students, sim.schools)
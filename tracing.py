@@ -0,0 +1,186 @@
+"""结构化的调试追踪
+
+打开追踪时 MatchingSimulation 使用单独的带追踪DA引擎，把匹配过程记录为结构化事件并交给 sink；
+没有打开追踪时使用不含任何调试分支的引擎，不产生额外开销。
+
+事件为可以直接序列化为JSON的字典，"event" 字段为事件类型：
+- da_start:     {"student_prefs", "school_prefs", "capacities"}
+- round_start:  {"round", "unmatched"}
+- proposal:     {"round", "student", "school"}
+- exhausted:    {"round", "student"}             学生已申请完所有学校
+- accept:       {"round", "school", "student"}
+- reject:       {"round", "school", "student"}   包括被新申请者替换的已匹配学生
+- round_end:    {"round", "matches"}             各学校当前接受的学生
+- da_end:       {"matching"}
+- preferences_sampled:  {"student_perms", "school_perms"}   generate_all_preferences 的采样结果
+- updated_preferences:  {"student", "matched_school", "options"}   generate_updated_preferences 的结果
+
+sink 是任何带有 emit(event) 方法的对象。记录下的追踪可以用 replay_trace 重放，
+由 accept/reject 事件重建每次DA的匹配结果并与 da_end 记录的结果核对。
+"""
+import json
+from collections import deque
+from typing import Dict, Iterable, Iterator, List
+
+from result_io import _dumps, _open_text
+
+
+class RingBufferSink:
+    """在内存中保留最近 maxlen 个事件"""
+
+    def __init__(self, maxlen: int = 100000):
+        self.events = deque(maxlen=maxlen)
+
+    def emit(self, event: dict):
+        self.events.append(event)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.events)
+
+    def clear(self):
+        self.events.clear()
+
+
+class FileSink:
+    """把事件逐行写入JSONL文件（文件名以 .gz 结尾时使用gzip压缩）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = _open_text(path, 'w')
+
+    def emit(self, event: dict):
+        self._file.write(_dumps(event) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConsoleSink:
+    """把事件格式化为文字打印到控制台，即原来调试模式的输出"""
+
+    def emit(self, event: dict):
+        print(format_event(event))
+
+
+def format_event(event: dict) -> str:
+    """把事件格式化为一行（或几行）可读的文字"""
+    kind = event["event"]
+    if kind == "da_start":
+        return (f"\n开始DA算法匹配过程:\n初始学生偏好: {event['student_prefs']}\n"
+                f"学校偏好: {event['school_prefs']}")
+    if kind == "round_start":
+        return f"\n第{event['round']}轮匹配:\n未匹配学生: {event['unmatched']}"
+    if kind == "proposal":
+        return f"{event['student']}申请{event['school']}"
+    if kind == "exhausted":
+        return f"{event['student']}已申请完所有学校"
+    if kind == "accept":
+        return f"{event['school']}接受{event['student']}"
+    if kind == "reject":
+        return f"{event['school']}拒绝{event['student']}"
+    if kind == "round_end":
+        return f"当前学校匹配情况: {event['matches']}"
+    if kind == "da_end":
+        return f"\n最终匹配结果: {event['matching']}"
+    if kind == "preferences_sampled":
+        return (f"生成的偏好样本:\n学生对学校的偏好样本: {event['student_perms'][0]}\n"
+                f"学校对学生的偏好样本: {event['school_perms'][0]}")
+    if kind == "updated_preferences":
+        return (f"{event['student']}匹配到{event['matched_school']}，"
+                f"可能的更新偏好: {event['options']}（共{len(event['options'])}种）")
+    return str(event)
+
+
+def traced_da(students: List[str], schools: List[str], capacities: List[int],
+              student_prefs: Dict[str, List[str]], school_prefs: Dict[str, List[str]],
+              sink) -> Dict[str, str]:
+    """逐轮执行的DA算法，与 MatchingSimulation 的 legacy 引擎相同，并把每一步记录为事件"""
+    emit = sink.emit
+    student_index = {student: i for i, student in enumerate(students)}
+    unmatched_students = list(students)
+    capacities = dict(zip(schools, capacities))
+    school_matches = {school: [] for school in schools}
+    student_proposals = {student: 0 for student in students}
+    emit({"event": "da_start", "student_prefs": {s: list(p) for s, p in student_prefs.items()},
+          "school_prefs": {c: list(p) for c, p in school_prefs.items()}, "capacities": capacities})
+
+    round_num = 1
+    while unmatched_students:
+        emit({"event": "round_start", "round": round_num, "unmatched": list(unmatched_students)})
+        current_proposals = {}
+        for student in list(unmatched_students):
+            if student_proposals[student] >= len(student_prefs[student]):
+                emit({"event": "exhausted", "round": round_num, "student": student})
+                unmatched_students.remove(student)
+                continue
+            school = student_prefs[student][student_proposals[student]]
+            student_proposals[student] += 1
+            current_proposals.setdefault(school, []).append(student)
+            emit({"event": "proposal", "round": round_num, "student": student, "school": school})
+
+        for school, applicants in current_proposals.items():
+            current_matches = school_matches[school]
+            applicants.extend(current_matches)
+            applicants.sort(key=lambda x: school_prefs[school].index(x))
+            accepted = applicants[:capacities[school]]
+            for student in accepted:
+                if student not in current_matches:
+                    emit({"event": "accept", "round": round_num, "school": school, "student": student})
+                    unmatched_students.remove(student)
+            for student in applicants[len(accepted):]:
+                emit({"event": "reject", "round": round_num, "school": school, "student": student})
+                if student in current_matches:
+                    unmatched_students.append(student)
+            school_matches[school] = accepted
+
+        emit({"event": "round_end", "round": round_num,
+              "matches": {school: list(matched) for school, matched in school_matches.items()}})
+        round_num += 1
+
+    final_matching = {student: school for school in schools
+                      for student in sorted(school_matches[school], key=student_index.get)}
+    emit({"event": "da_end", "matching": final_matching})
+    return final_matching
+
+
+def load_trace(path: str) -> Iterator[dict]:
+    """逐个读取 FileSink 写入的事件"""
+    with _open_text(path, 'r') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def replay_trace(events: Iterable[dict]) -> List[Dict[str, str]]:
+    """
+    重放追踪，返回每次DA由 accept/reject 事件重建的匹配结果
+
+    重建结果与 da_end 记录的结果不一致时抛出 ValueError。
+    环形缓冲区丢弃了某次DA开头的事件时，该次DA被跳过。
+    """
+    matchings = []
+    holdings = None
+    for event in events:
+        kind = event["event"]
+        if kind == "da_start":
+            holdings = {}
+        elif holdings is None:
+            continue
+        elif kind == "accept":
+            holdings[event["student"]] = event["school"]
+        elif kind == "reject":
+            if holdings.get(event["student"]) == event["school"]:
+                del holdings[event["student"]]
+        elif kind == "da_end":
+            if holdings != event["matching"]:
+                raise ValueError(f"重放的匹配结果 {holdings} 与记录的结果 {event['matching']} 不一致")
+            matchings.append(event["matching"])
+            holdings = None
+    return matchings